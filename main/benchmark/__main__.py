@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from main.benchmark.runner import entrypoint
+
+entrypoint()
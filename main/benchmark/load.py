@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+import struct
+import time
+from array import array
+
+# function code -> maximal quantity per request allowed by Modbus
+QUANTITY_LIMITS = {
+    0x01: 2000,
+    0x02: 2000,
+    0x03: 125,
+    0x04: 125,
+    0x05: 1,
+    0x06: 1,
+    0x0F: 1968,
+    0x10: 123,
+    0x16: 1,
+    0x17: 121,
+}
+
+
+def build_request(code: int, quantity: int, unit: int) -> bytearray:
+    """
+    Build request template, transaction id is patched in before send
+    :param code: function code
+    :param quantity: number of coils or registers
+    :param unit: slave address
+    :return: MBAP framed request
+    """
+    quantity = min(quantity, QUANTITY_LIMITS[code])
+    if code in (0x01, 0x02, 0x03, 0x04):
+        pdu = struct.pack('>BHH', code, 0, quantity)
+    elif code == 0x05:
+        pdu = struct.pack('>BHH', code, 0, 0xFF00)
+    elif code == 0x06:
+        pdu = struct.pack('>BHH', code, 0, 0x1234)
+    elif code == 0x0F:
+        values = bytes((quantity + 7) // 8)
+        pdu = struct.pack('>BHHB', code, 0, quantity, len(values)) + values
+    elif code == 0x10:
+        values = bytes(quantity * 2)
+        pdu = struct.pack('>BHHB', code, 0, quantity, len(values)) + values
+    elif code == 0x16:
+        pdu = struct.pack('>BHHH', code, 0, 0x00F2, 0x0025)
+    elif code == 0x17:
+        values = bytes(quantity * 2)
+        pdu = struct.pack('>BHHHHB', code, 0, quantity, 100, quantity, len(values)) + values
+    else:
+        raise ValueError(f'Benchmark: function code is not supported: {code}')
+    return bytearray(struct.pack('>HHHB', 0, 0, len(pdu) + 1, unit) + pdu)
+
+
+class Plan:
+    """
+    What a client sends: function code mix, quantities and unit ids.
+    """
+    def __init__(self, mix: dict, quantities: list, units: int, seed=None):
+        """
+        :param mix: function code -> weight
+        :param quantities: quantities to pick from
+        :param units: requests go to slaves 1..units
+        :param seed: seed of request choice, for repeatable runs
+        """
+        self.random = random.Random(seed)
+        self.templates = []
+        self.codes = []
+        for code in mix:
+            for quantity in quantities:
+                for unit in range(1, units + 1):
+                    self.templates.append(build_request(code, quantity, unit))
+                    self.codes.append(code)
+        weights = []
+        for code in self.codes:
+            weights.append(mix[code] / (len(quantities) * units))
+        self.weights = weights
+
+    def requests(self, count: int) -> list:
+        return self.random.choices(range(len(self.templates)), weights=self.weights, k=count)
+
+
+class Client:
+    """
+    One connection keeping `depth` requests in flight.
+    """
+    def __init__(self, plan: Plan, depth: int):
+        self.plan = plan
+        self.depth = depth
+        self.latencies = {}
+        self.errors = 0
+        self.exceptions = 0
+
+    async def run(self, host: str, port: int, deadline: float):
+        (reader, writer) = await asyncio.open_connection(host, port)
+        in_flight = {}
+        transaction = 0
+        choices = []
+
+        def send(count: int):
+            nonlocal transaction, choices
+            batch = []
+            for _ in range(count):
+                if not choices:
+                    choices = self.plan.requests(1024)
+                index = choices.pop()
+                transaction = (transaction + 1) & 0xFFFF
+                request = self.plan.templates[index]
+                request[0] = transaction >> 8
+                request[1] = transaction & 0xFF
+                batch.append(bytes(request))
+                in_flight[transaction] = (self.plan.codes[index], time.perf_counter())
+            writer.write(b''.join(batch))
+
+        try:
+            send(self.depth)
+            while in_flight:
+                header = await reader.readexactly(6)
+                body = await reader.readexactly((header[4] << 8) | header[5])
+                now = time.perf_counter()
+                (code, started) = in_flight.pop((header[0] << 8) | header[1], (None, None))
+                if code is None:
+                    self.errors += 1
+                    continue
+                if body[1] & 0x80:
+                    self.exceptions += 1
+                self.latencies.setdefault(code, array('d')).append(now - started)
+                if now < deadline:
+                    send(1)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.errors += len(in_flight) + 1
+        finally:
+            writer.close()
+
+
+def run_clients(host: str, port: int, clients: int, depth: int, duration: float,
+                mix: dict, quantities: list, units: int, seed=None) -> dict:
+    """
+    Drive server with `clients` connections for `duration` seconds.
+    Supposed to be called in a separate process, one event loop per process.
+    :return: latencies per function code and error counters
+    """
+    plan = Plan(mix, quantities, units, seed)
+    connections = [Client(plan, depth) for _ in range(clients)]
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    loop.run_until_complete(asyncio.gather(*[c.run(host, port, deadline) for c in connections]))
+    elapsed = time.perf_counter() - started
+    loop.close()
+    latencies = {}
+    for connection in connections:
+        for code, values in connection.latencies.items():
+            latencies.setdefault(code, array('d')).extend(values)
+    return {
+        'elapsed': elapsed,
+        'latencies': latencies,
+        'errors': sum(c.errors for c in connections),
+        'exceptions': sum(c.exceptions for c in connections),
+    }
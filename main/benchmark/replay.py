@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Replay of recorded traffic log against modbus-slave, responses are checked to be byte-identical.
+# Example: modbus-slave-replay traffic.bin --speed 10 --json replay.json
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from main.benchmark.runner import start_server
+from main.recorder import read_log
+
+
+class Session:
+    """
+    Recorded connection replayed over its own connection, in recorded order.
+    Frames to a unit also written by other connections wait until the frame recorded before them is answered,
+    so sessions do not race each other on shared tables.
+    """
+    def __init__(self, records: list, indexes: list, after: list):
+        """
+        :param indexes: position of every record in the log
+        :param after: position of the frame to the same unit recorded before the record by another session or None
+        """
+        self.records = records
+        self.indexes = indexes
+        self.after = after
+        self.matched = 0
+        self.mismatched = {}
+        self.errors = 0
+
+    async def run(self, host: str, port: int, started: float, first: float, speed: float, depth: int,
+                  answered: dict):
+        """
+        :param started: loop time replay started at
+        :param first: recorded time of the first frame of the log
+        :param speed: multiplier of recorded pace, 0 to send as fast as responses come back
+        :param depth: frames in flight
+        :param answered: position in the log -> event set when frame other sessions wait for is answered
+        """
+        loop = asyncio.get_event_loop()
+        (reader, writer) = await asyncio.open_connection(host, port)
+        window = asyncio.Semaphore(depth)
+
+        async def receive():
+            for (record, index) in zip(self.records, self.indexes):
+                header = await reader.readexactly(6)
+                response = header + await reader.readexactly((header[4] << 8) | header[5])
+                window.release()
+                if index in answered:
+                    answered[index].set()
+                if response == record.response:
+                    self.matched += 1
+                    continue
+                self.mismatched[record.code] = self.mismatched.get(record.code, 0) + 1
+                logging.debug(f'Replay: unit {record.unit} code {record.code} request {record.request.hex()}: '
+                              f'expected {record.response.hex()}, got {response.hex()}')
+
+        async def unless_closed(waiting):
+            # only receiver releases window and answers frames, it may fail instead when server drops connection
+            waiter = asyncio.ensure_future(waiting)
+            await asyncio.wait([waiter, receiver], return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            for (record, after) in zip(self.records, self.after):
+                if speed:
+                    delay = started + (record.time - first) / speed - loop.time()
+                    if delay > 0:
+                        await asyncio.wait([receiver], timeout=delay)
+                if after is not None and not answered[after].is_set():
+                    await unless_closed(answered[after].wait())
+                if not window.locked():
+                    await window.acquire()
+                else:
+                    await unless_closed(window.acquire())
+                if receiver.done():
+                    break
+                writer.write(record.request)
+            await receiver
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.errors += len(self.records) - self.matched - sum(self.mismatched.values())
+        finally:
+            receiver.cancel()
+            writer.close()
+            # frames of a broken session will not be answered, sessions waiting for them go on
+            for index in self.indexes:
+                if index in answered:
+                    answered[index].set()
+
+
+def load_sessions(path: str) -> tuple:
+    """
+    :return: (sessions, recorded time of first frame, frames skipped)
+    Frames answered by closing connection are skipped, replaying them would end the session.
+    """
+    sessions = {}
+    first = None
+    skipped = 0
+    # unit -> (session, position) of the last frame to it
+    last = {}
+    for (index, record) in enumerate(read_log(path)):
+        if first is None:
+            first = record.time
+        if not record.response:
+            skipped += 1
+            continue
+        (previous, position) = last.get(record.unit, (record.session, None))
+        (records, indexes, after) = sessions.setdefault(record.session, ([], [], []))
+        records.append(record)
+        indexes.append(index)
+        # frames of one session are ordered by its connection already
+        after.append(position if previous != record.session else None)
+        last[record.unit] = (record.session, index)
+    return [Session(*lists) for _, lists in sorted(sessions.items())], first, skipped
+
+
+def replay(path: str, host: str, port: int, speed: float, depth: int) -> dict:
+    (sessions, first, skipped) = load_sessions(path)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    answered = {index: asyncio.Event() for s in sessions for index in s.after if index is not None}
+    started = time.perf_counter()
+    loop.run_until_complete(asyncio.gather(*[s.run(host, port, loop.time(), first, speed, depth, answered)
+                                             for s in sessions]))
+    elapsed = time.perf_counter() - started
+    loop.close()
+    mismatched = {}
+    for session in sessions:
+        for code, count in session.mismatched.items():
+            mismatched[str(code)] = mismatched.get(str(code), 0) + count
+    frames = sum(len(s.records) for s in sessions)
+    return {
+        'log': path,
+        'target': f'{host}:{port}',
+        'speed': speed,
+        'depth': depth,
+        'sessions': len(sessions),
+        'frames': frames,
+        'skipped': skipped,
+        'matched': sum(s.matched for s in sessions),
+        'mismatched': mismatched,
+        'errors': sum(s.errors for s in sessions),
+        'elapsed': elapsed,
+        'rps': frames / elapsed if elapsed else 0.0,
+    }
+
+
+def to_text(result: dict) -> str:
+    lines = [
+        f'log {result["log"]} -> {result["target"]}, speed {result["speed"] or "flat out"}, depth {result["depth"]}',
+        f'sessions: {result["sessions"]}, frames: {result["frames"]}, skipped: {result["skipped"]}',
+        f'matched: {result["matched"]}, errors: {result["errors"]}',
+        f'elapsed: {result["elapsed"]:.3f} s, {result["rps"]:.0f} req/s',
+    ]
+    for code, count in sorted(result['mismatched'].items(), key=lambda item: int(item[0])):
+        lines.append(f'mismatched responses to code {code}: {count}')
+    return '\n'.join(lines)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='modbus-slave-replay',
+                                     description='Replay traffic log and check responses are byte-identical')
+    parser.add_argument('log', help='traffic log written with RECORD_FILE')
+    parser.add_argument('--target', help='host:port of running server, local one is started if omitted')
+    parser.add_argument('--port', type=int, default=15020, help='port for local server')
+    parser.add_argument('--server-env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment variable for local server')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='multiplier of recorded pace, 0 to send as fast as responses come back')
+    parser.add_argument('--depth', type=int, default=16, help='frames in flight per session at most')
+    parser.add_argument('--json', metavar='PATH', help='write result as JSON, - for stdout')
+    return parser.parse_args(argv)
+
+
+def entrypoint(argv=None):
+    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s', level=logging.INFO)
+    args = parse_arguments(argv)
+    server = None
+    if args.target:
+        (host, _, port) = args.target.rpartition(':')
+        port = int(port)
+    else:
+        units = max((record.unit for record in read_log(args.log)), default=1)
+        (host, port) = ('127.0.0.1', args.port)
+        server = start_server(port, units, args.server_env)
+    try:
+        result = replay(args.log, host, port, args.speed, max(1, args.depth))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    if args.json == '-':
+        print(json.dumps(result, indent=2, sort_keys=True))
+    else:
+        print(to_text(result))
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump(result, file, indent=2, sort_keys=True)
+    if result['mismatched'] or result['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    entrypoint()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+PERCENTILES = (('p50', 0.50), ('p99', 0.99), ('p999', 0.999))
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(results: list, settings: dict) -> dict:
+    """
+    Merge results of all load processes
+    :param results: return values of load.run_clients
+    :param settings: benchmark parameters, copied into report as is
+    :return: report ready to be dumped as JSON
+    """
+    elapsed = max(r['elapsed'] for r in results)
+    merged = {}
+    for result in results:
+        for code, values in result['latencies'].items():
+            merged.setdefault(code, []).extend(values)
+    codes = {}
+    total = 0
+    for code in sorted(merged):
+        ordered = sorted(merged[code])
+        total += len(ordered)
+        stats = {
+            'requests': len(ordered),
+            'rps': len(ordered) / elapsed,
+        }
+        for (name, fraction) in PERCENTILES:
+            stats[f'{name}_ms'] = percentile(ordered, fraction) * 1000
+        codes[str(code)] = stats
+    return {
+        'settings': settings,
+        'elapsed': elapsed,
+        'requests': total,
+        'rps': total / elapsed,
+        'errors': sum(r['errors'] for r in results),
+        'exceptions': sum(r['exceptions'] for r in results),
+        'codes': codes,
+    }
+
+
+def to_text(report: dict) -> str:
+    lines = [f'{"code":>6}{"requests":>12}{"req/s":>12}{"p50 ms":>10}{"p99 ms":>10}{"p999 ms":>10}']
+    for code, stats in report['codes'].items():
+        lines.append(f'{code:>6}{stats["requests"]:>12}{stats["rps"]:>12.0f}'
+                     f'{stats["p50_ms"]:>10.3f}{stats["p99_ms"]:>10.3f}{stats["p999_ms"]:>10.3f}')
+    lines.append(f'{"total":>6}{report["requests"]:>12}{report["rps"]:>12.0f}')
+    lines.append(f'errors: {report["errors"]}, exception responses: {report["exceptions"]}')
+    return '\n'.join(lines)
+
+
+def to_json(report: dict) -> str:
+    return json.dumps(report, indent=2, sort_keys=True)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Throughput and latency benchmark of modbus-slave on localhost.
+# Example: modbus-slave-benchmark --clients 32 --depth 4 --mix 3:80,16:20 --json result.json
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from main.benchmark.load import run_clients, QUANTITY_LIMITS
+from main.benchmark import report
+
+
+def parse_mix(value: str) -> dict:
+    """
+    :param value: comma separated code:weight pairs, e.g. '3:70,4:20,16:10'
+    :return: function code -> weight
+    """
+    mix = {}
+    for item in value.split(','):
+        (code, _, weight) = item.partition(':')
+        code = int(code, 0)
+        if code not in QUANTITY_LIMITS:
+            raise argparse.ArgumentTypeError(f'function code is not supported: {code}')
+        mix[code] = float(weight or 1)
+    return mix
+
+
+def parse_quantities(value: str) -> list:
+    return [int(item) for item in value.split(',')]
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='modbus-slave-benchmark', description=__doc__)
+    parser.add_argument('--target', help='host:port of running server, local one is started if omitted')
+    parser.add_argument('--port', type=int, default=15020, help='port for local server')
+    parser.add_argument('--server-env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment variable for local server, e.g. WORKERS=4')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent connections')
+    parser.add_argument('--processes', type=int, default=1, help='load generating processes')
+    parser.add_argument('--depth', type=int, default=1, help='requests in flight per connection')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default={0x03: 1.0}, help='code:weight pairs, e.g. 3:70,4:20,16:10')
+    parser.add_argument('--quantity', type=parse_quantities, default=[1, 16, 125],
+                        help='comma separated quantities of registers or coils')
+    parser.add_argument('--units', type=int, default=1, help='spread requests over slaves 1..units')
+    parser.add_argument('--seed', type=int, default=None, help='seed of request choice')
+    parser.add_argument('--json', metavar='PATH', help='write report as JSON, - for stdout')
+    return parser.parse_args(argv)
+
+
+def start_server(port: int, units: int, env: list, wait=True) -> subprocess.Popen:
+    environment = dict(os.environ)
+    environment.update({'LISTEN_PORT': str(port), 'SLAVES_QTY': str(units), 'DEBUG': 'false'})
+    for item in env:
+        (name, _, value) = item.partition('=')
+        environment[name] = value
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, environment.get('PYTHONPATH')]))
+    process = subprocess.Popen([sys.executable, '-c', 'from main.main import entrypoint; entrypoint()'],
+                               env=environment)
+    if wait:
+        wait_for_port('127.0.0.1', port, process)
+    return process
+
+
+def wait_for_port(host: str, port: int, process: subprocess.Popen, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise Exception(f'Benchmark: server exited with code {process.returncode}')
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise Exception(f'Benchmark: server did not start listening on {port}')
+
+
+def load(args, host: str, port: int, clients: int, seed):
+    return run_clients(host, port, clients, args.depth, args.duration,
+                       args.mix, args.quantity, args.units, seed)
+
+
+def run(args) -> dict:
+    server = None
+    if args.target:
+        (host, _, port) = args.target.rpartition(':')
+        port = int(port)
+    else:
+        (host, port) = ('127.0.0.1', args.port)
+        server = start_server(port, args.units, args.server_env)
+    try:
+        processes = max(1, args.processes)
+        shares = [args.clients // processes + (1 if i < args.clients % processes else 0)
+                  for i in range(processes)]
+        jobs = []
+        for (i, clients) in enumerate(shares):
+            if clients:
+                seed = None if args.seed is None else args.seed + i
+                jobs.append((args, host, port, clients, seed))
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.starmap(load, jobs)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    settings = {
+        'target': f'{host}:{port}',
+        'clients': args.clients,
+        'processes': args.processes,
+        'depth': args.depth,
+        'duration': args.duration,
+        'mix': {str(code): weight for code, weight in args.mix.items()},
+        'quantity': args.quantity,
+        'units': args.units,
+        'server_env': args.server_env,
+    }
+    return report.summarize(results, settings)
+
+
+def entrypoint(argv=None):
+    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s', level=logging.INFO)
+    args = parse_arguments(argv)
+    result = run(args)
+    if args.json == '-':
+        print(report.to_json(result))
+        return
+    print(report.to_text(result))
+    if args.json:
+        with open(args.json, 'w') as file:
+            file.write(report.to_json(result))
+
+
+if __name__ == '__main__':
+    entrypoint()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Startup benchmark: time to first response and RSS for different numbers of slaves.
+# Usage: python -m main.benchmark.startup [--slaves 1,50,247] [--runs 5] [--json PATH]
+
+import argparse
+import json
+import socket
+import struct
+import time
+
+from main.benchmark.runner import start_server
+
+
+def rss_kib(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def first_response(port: int, unit: int, timeout=10.0) -> float:
+    """
+    Poll server until it answers FC3 request to unit
+    :return: monotonic time of the first response
+    """
+    request = struct.pack('>HHHBBHH', 1, 0, 6, unit, 0x03, 0, 1)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1.0) as client:
+                client.sendall(request)
+                if client.recv(256):
+                    return time.monotonic()
+        except OSError:
+            time.sleep(0.001)
+    raise Exception(f'Benchmark: no response from unit {unit}')
+
+
+def touch_all(port: int, slaves: int):
+    with socket.create_connection(('127.0.0.1', port)) as client:
+        for unit in range(1, slaves + 1):
+            client.sendall(struct.pack('>HHHBBHH', unit, 0, 6, unit, 0x03, 0, 125))
+            client.recv(512)
+
+
+def measure(slaves: int, port: int) -> dict:
+    started = time.monotonic()
+    server = start_server(port, slaves, [], wait=False)
+    try:
+        answered = first_response(port, slaves)
+        idle = rss_kib(server.pid)
+        touch_all(port, slaves)
+        return {
+            'first_response_ms': (answered - started) * 1000,
+            'idle_rss_kib': idle,
+            'rss_after_reading_all_kib': rss_kib(server.pid),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def entrypoint(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m main.benchmark.startup')
+    parser.add_argument('--slaves', default='1,50,247', help='comma separated numbers of slaves')
+    parser.add_argument('--runs', type=int, default=5, help='runs per number of slaves, median is reported')
+    parser.add_argument('--port', type=int, default=15020)
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    args = parser.parse_args(argv)
+    results = {}
+    print(f'{"slaves":>8}{"first response ms":>20}{"idle RSS KiB":>14}{"RSS after reads KiB":>21}')
+    for slaves in [int(item) for item in args.slaves.split(',')]:
+        runs = [measure(slaves, args.port) for _ in range(args.runs)]
+        result = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+        results[str(slaves)] = result
+        print(f'{slaves:>8}{result["first_response_ms"]:>20.1f}{result["idle_rss_kib"]:>14}'
+              f'{result["rss_after_reading_all_kib"]:>21}')
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    entrypoint()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+# table -> function code reading it, written ranges of the table invalidate responses of the code
+READ_CODES = {'coils': 0x01, 'contacts': 0x02, 'holding': 0x03, 'input': 0x04}
+
+
+class ResponseCache:
+    """
+    Encoded read responses of one slave, least recently used ones are evicted.
+    Responses are keyed by function code, address and quantity bytes of request
+    and stored without transaction and protocol ids, so a hit costs one lookup and one concatenation.
+    """
+    def __init__(self, size: int, lock=None):
+        """
+        :param size: responses kept at most
+        :param lock: lock guarding entries if tables are written by injection threads too
+        """
+        self.size = size
+        self.lock = lock
+        # key -> (length, unit id and PDU, function code, first address, end address)
+        self.entries = OrderedDict()
+        # incremented by every invalidation, so response read before concurrent write is not kept
+        self.version = 0
+
+    def get(self, request: bytes):
+        """
+        :param request: MBAP frame
+        :return: response to request or None if it is not cached
+        """
+        if self.lock:
+            with self.lock:
+                return self._get(request)
+        return self._get(request)
+
+    def _get(self, request: bytes):
+        entry = self.entries.get(request[7:12])
+        if entry is None:
+            return None
+        self.entries.move_to_end(request[7:12])
+        response = bytearray(request[:4])
+        response += entry[0]
+        return response
+
+    def store(self, request: bytes, response, version: int):
+        """
+        :param request: read request, already validated
+        :param response: its response
+        :param version: value of version before tables were read
+        """
+        if self.lock:
+            with self.lock:
+                self._store(request, response, version)
+        else:
+            self._store(request, response, version)
+
+    def _store(self, request: bytes, response, version: int):
+        (code, address, quantity) = (request[7], (request[8] << 8) | request[9], (request[10] << 8) | request[11])
+        key = request[7:12]
+        self.entries[key] = (bytes(response[4:]), code, address, address + quantity)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        # write happened while response was built and its invalidation may have missed the entry
+        if self.version != version:
+            self.entries.pop(key, None)
+
+    def invalidate(self, table: str, address: int, count: int):
+        """
+        Drop responses overlapping written range
+        :param table: one of TABLES
+        """
+        if self.lock:
+            with self.lock:
+                self._invalidate(table, address, count)
+        else:
+            self._invalidate(table, address, count)
+
+    def _invalidate(self, table: str, address: int, count: int):
+        self.version += 1
+        code = READ_CODES[table]
+        end = address + count
+        for key, entry in list(self.entries.items()):
+            if entry[1] == code and entry[2] < end and address < entry[3]:
+                del self.entries[key]
+
+    def clear(self):
+        if self.lock:
+            with self.lock:
+                self._clear()
+        else:
+            self._clear()
+
+    def _clear(self):
+        self.version += 1
+        self.entries.clear()
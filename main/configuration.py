@@ -6,6 +6,28 @@ import logging
 import yaml
 
 from os import getenv, path
+from types import SimpleNamespace
+
+# C implementation of the safe loader is several times faster, it is missing if PyYAML is built without libyaml
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def parse_units(value) -> set:
+    """
+    :param value: None for all units, int, list of ints or string like '1-10,20'
+    :return: set of unit ids
+    """
+    if value is None:
+        return set(range(1, 248))
+    if isinstance(value, int):
+        return {value}
+    if isinstance(value, str):
+        units = set()
+        for item in value.split(','):
+            (first, _, last) = item.strip().partition('-')
+            units.update(range(int(first), int(last or first) + 1))
+        return units
+    return {int(unit) for unit in value}
 
 
 class Configuration(object):
@@ -36,36 +58,256 @@ class Configuration(object):
             self.debug = debug
 
     class ServerConfiguration:
-        def __init__(self, port=1502):
+        def __init__(self, port=1502, transport='tcp', workers=1, engine='selectors', idle_timeout=60.0,
+                     read_timeout=10.0, max_connections=1024, output_limit=65536, record='', inject='',
+                     udp_port=0, tls_port=0, tls_cert='', tls_key='', tls_ca=''):
             self.port = port
+            self.transport = transport
+            self.workers = workers
+            self.engine = engine
+            self.idle_timeout = idle_timeout
+            self.read_timeout = read_timeout
+            self.max_connections = max_connections
+            self.output_limit = output_limit
+            self.record = record
+            self.inject = inject
+            self.udp_port = udp_port
+            self.tls_port = tls_port
+            self.tls_cert = tls_cert
+            self.tls_key = tls_key
+            self.tls_ca = tls_ca
 
     class SlaveConfiguration:
-        def __init__(self, quantity=1, random=False):
+        def __init__(self, quantity=1, units=None, random=False, state='', signals=None, random_contacts=True,
+                     response_cache=0):
             self.quantity = quantity
+            self.units = units
             self.random = random
-            pass
+            self.random_contacts = random_contacts
+            self.response_cache = response_cache
+            self.state = state
+            self.signals = signals or []
+
+        def unit_ids(self) -> set:
+            """
+            :return: unit ids of slaves: `units` if set, 1..quantity otherwise
+            """
+            if self.units is not None:
+                return parse_units(self.units)
+            return set(range(1, self.quantity + 1))
+
+    class RtuConfiguration:
+        def __init__(self, device='', baudrate=115200, link='/tmp/modbus-rtu', ignore_crc=False):
+            self.device = device
+            self.baudrate = baudrate
+            self.link = link
+            self.ignore_crc = ignore_crc
+
+    class MetricsConfiguration:
+        def __init__(self, port=0, file='', interval=60.0):
+            self.port = port
+            self.file = file
+            self.interval = interval
+
+    class LimitsConfiguration:
+        def __init__(self, client_rate=0.0, unit_rate=0.0, burst=0.0):
+            self.client_rate = client_rate
+            self.unit_rate = unit_rate
+            self.burst = burst
+
+    class ProfileConfiguration:
+        def __init__(self, enabled=False, mode='cprofile', duration=30.0, path='/tmp/modbus-profile', interval=0.005):
+            self.enabled = enabled
+            self.mode = mode
+            self.duration = duration
+            self.path = path
+            self.interval = interval
+
+    @staticmethod
+    def groups() -> dict:
+        """
+        :return: attribute name -> class of configuration group
+        """
+        return {
+            'general': Configuration.GeneralConfiguration,
+            'server': Configuration.ServerConfiguration,
+            'slave': Configuration.SlaveConfiguration,
+            'rtu': Configuration.RtuConfiguration,
+            'metrics': Configuration.MetricsConfiguration,
+            'limits': Configuration.LimitsConfiguration,
+            'profile': Configuration.ProfileConfiguration,
+        }
+
+    @staticmethod
+    def modified_time():
+        try:
+            return path.getmtime(getenv('CONFIG_PATH', '/app/config.yaml'))
+        except OSError:
+            return None
+
+    def changed(self) -> bool:
+        """
+        :return: True if config file was modified, created or removed since it was read
+        """
+        return Configuration.modified_time() != self.mtime
 
-    def _read_config_file(self):
+    def reload(self) -> set:
+        """
+        Read YAML and environment variables again. New settings are read into fresh groups first,
+        then copied into current groups at once, so objects holding them see either old or new values,
+        never defaults in between. Settings are kept if file can not be parsed.
+        :return: names of changed settings, e.g. {'slave.quantity'}
+        """
+        staged = SimpleNamespace(config=self.config, mtime=self.mtime,
+                                 **{name: group() for name, group in Configuration.groups().items()})
+        try:
+            parsed = Configuration._read_config_file(staged)
+            if parsed:
+                Configuration._read_env_vars(staged)
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f'Config: reload error: {str(e)}')
+            parsed = False
+        # broken file is not read again until it is modified
+        self.mtime = staged.mtime
+        if not parsed:
+            return set()
+        self.config = staged.config
+        changes = set()
+        for name in Configuration.groups():
+            (current, values) = (vars(getattr(self, name)), vars(getattr(staged, name)))
+            for key, value in values.items():
+                if current.get(key) != value:
+                    changes.add(f'{name}.{key}')
+            current.update(values)
+        return changes
+
+    def _read_config_file(self) -> bool:
+        """
+        :return: False if file exists but can not be parsed
+        """
         conf_path = getenv('CONFIG_PATH', '/app/config.yaml')
+        self.mtime = Configuration.modified_time()
         if path.exists(conf_path):
             with open(conf_path, 'r') as file:
                 try:
-                    self.config = yaml.load(file)
+                    self.config = yaml.load(file, Loader=Loader) or {}
                     logging.debug(self.config)
                     self.general.debug = self.config.get('server', {}).get('debug', False)
                     self.server.port = int(self.config.get('server', {}).get('port', 1502))
+                    self.server.transport = str(self.config.get('server', {}).get('transport', 'tcp'))
+                    self.server.workers = int(self.config.get('server', {}).get('workers', 1))
+                    self.server.engine = str(self.config.get('server', {}).get('engine', 'selectors'))
+                    self.server.idle_timeout = float(self.config.get('server', {}).get('idle_timeout', 60.0))
+                    self.server.read_timeout = float(self.config.get('server', {}).get('read_timeout', 10.0))
+                    self.server.max_connections = int(self.config.get('server', {}).get('max_connections', 1024))
+                    self.server.output_limit = int(self.config.get('server', {}).get('output_limit', 65536))
+                    self.server.record = str(self.config.get('server', {}).get('record', ''))
+                    self.server.inject = str(self.config.get('server', {}).get('inject', ''))
+                    self.server.udp_port = int(self.config.get('server', {}).get('udp_port', 0))
+                    self.server.tls_port = int(self.config.get('server', {}).get('tls_port', 0))
+                    self.server.tls_cert = str(self.config.get('server', {}).get('tls_cert', ''))
+                    self.server.tls_key = str(self.config.get('server', {}).get('tls_key', ''))
+                    self.server.tls_ca = str(self.config.get('server', {}).get('tls_ca', ''))
                     self.slave.quantity = int(self.config.get('slave', {}).get('quantity', 1))
+                    self.slave.units = self.config.get('slave', {}).get('units', None)
                     self.slave.random = bool(self.config.get('slave', {}).get('random', False))
+                    self.slave.random_contacts = bool(self.config.get('slave', {}).get('random_contacts', True))
+                    self.slave.response_cache = int(self.config.get('slave', {}).get('response_cache', 0))
+                    self.slave.state = str(self.config.get('slave', {}).get('state', ''))
+                    self.slave.signals = list(self.config.get('slave', {}).get('signals', None) or [])
+                    self.rtu.device = str(self.config.get('rtu', {}).get('device', ''))
+                    self.rtu.baudrate = int(self.config.get('rtu', {}).get('baudrate', 115200))
+                    self.rtu.link = str(self.config.get('rtu', {}).get('link', '/tmp/modbus-rtu'))
+                    self.rtu.ignore_crc = bool(self.config.get('rtu', {}).get('ignore_crc', False))
+                    self.metrics.port = int(self.config.get('metrics', {}).get('port', 0))
+                    self.metrics.file = str(self.config.get('metrics', {}).get('file', ''))
+                    self.metrics.interval = float(self.config.get('metrics', {}).get('interval', 60.0))
+                    self.limits.client_rate = float(self.config.get('limits', {}).get('client_rate', 0.0))
+                    self.limits.unit_rate = float(self.config.get('limits', {}).get('unit_rate', 0.0))
+                    self.limits.burst = float(self.config.get('limits', {}).get('burst', 0.0))
+                    self.profile.enabled = bool(self.config.get('profile', {}).get('enabled', False))
+                    self.profile.mode = str(self.config.get('profile', {}).get('mode', 'cprofile'))
+                    self.profile.duration = float(self.config.get('profile', {}).get('duration', 30.0))
+                    self.profile.path = str(self.config.get('profile', {}).get('path', '/tmp/modbus-profile'))
+                    self.profile.interval = float(self.config.get('profile', {}).get('interval', 0.005))
                 except yaml.YAMLError as e:
                     logging.error(f'Config: YAML parse error: {str(e)}')
+                    return False
+        return True
 
     def _read_env_vars(self):
         if getenv('LISTEN_PORT'):
             self.server.port = int(getenv('LISTEN_PORT', 1502))
+        if getenv('TRANSPORT'):
+            self.server.transport = getenv('TRANSPORT').lower()
+        if getenv('WORKERS'):
+            self.server.workers = int(getenv('WORKERS'))
+        if getenv('SERVER_ENGINE'):
+            self.server.engine = getenv('SERVER_ENGINE').lower()
+        if getenv('IDLE_TIMEOUT'):
+            self.server.idle_timeout = float(getenv('IDLE_TIMEOUT'))
+        if getenv('READ_TIMEOUT'):
+            self.server.read_timeout = float(getenv('READ_TIMEOUT'))
+        if getenv('MAX_CONNECTIONS'):
+            self.server.max_connections = int(getenv('MAX_CONNECTIONS'))
+        if getenv('OUTPUT_LIMIT'):
+            self.server.output_limit = int(getenv('OUTPUT_LIMIT'))
+        if getenv('RECORD_FILE'):
+            self.server.record = getenv('RECORD_FILE')
+        if getenv('INJECT_SOCKET'):
+            self.server.inject = getenv('INJECT_SOCKET')
+        if getenv('UDP_PORT'):
+            self.server.udp_port = int(getenv('UDP_PORT'))
+        if getenv('TLS_PORT'):
+            self.server.tls_port = int(getenv('TLS_PORT'))
+        if getenv('TLS_CERT'):
+            self.server.tls_cert = getenv('TLS_CERT')
+        if getenv('TLS_KEY'):
+            self.server.tls_key = getenv('TLS_KEY')
+        if getenv('TLS_CA'):
+            self.server.tls_ca = getenv('TLS_CA')
         if getenv('SLAVES_QTY'):
             self.slave.quantity = int(getenv('SLAVES_QTY', 1))
+        if getenv('SLAVE_UNITS'):
+            self.slave.units = getenv('SLAVE_UNITS')
         if getenv('RANDOM'):
             self.slave.random = getenv('RANDOM').lower() == 'true'
+        if getenv('RANDOM_CONTACTS'):
+            self.slave.random_contacts = getenv('RANDOM_CONTACTS').lower() == 'true'
+        if getenv('RESPONSE_CACHE'):
+            self.slave.response_cache = int(getenv('RESPONSE_CACHE'))
+        if getenv('STATE_FILE'):
+            self.slave.state = getenv('STATE_FILE')
+        if getenv('RTU_DEVICE'):
+            self.rtu.device = getenv('RTU_DEVICE')
+        if getenv('RTU_BAUDRATE'):
+            self.rtu.baudrate = int(getenv('RTU_BAUDRATE'))
+        if getenv('RTU_LINK') is not None:
+            self.rtu.link = getenv('RTU_LINK')
+        if getenv('RTU_IGNORE_CRC'):
+            self.rtu.ignore_crc = getenv('RTU_IGNORE_CRC').lower() == 'true'
+        if getenv('METRICS_PORT'):
+            self.metrics.port = int(getenv('METRICS_PORT'))
+        if getenv('METRICS_FILE'):
+            self.metrics.file = getenv('METRICS_FILE')
+        if getenv('METRICS_INTERVAL'):
+            self.metrics.interval = float(getenv('METRICS_INTERVAL'))
+        if getenv('CLIENT_RATE_LIMIT'):
+            self.limits.client_rate = float(getenv('CLIENT_RATE_LIMIT'))
+        if getenv('UNIT_RATE_LIMIT'):
+            self.limits.unit_rate = float(getenv('UNIT_RATE_LIMIT'))
+        if getenv('RATE_BURST'):
+            self.limits.burst = float(getenv('RATE_BURST'))
+        if getenv('PROFILE'):
+            self.profile.enabled = getenv('PROFILE').lower() == 'true'
+        if getenv('PROFILE_MODE'):
+            self.profile.mode = getenv('PROFILE_MODE').lower()
+        if getenv('PROFILE_DURATION'):
+            self.profile.duration = float(getenv('PROFILE_DURATION'))
+        if getenv('PROFILE_PATH'):
+            self.profile.path = getenv('PROFILE_PATH')
+        if getenv('PROFILE_INTERVAL'):
+            self.profile.interval = float(getenv('PROFILE_INTERVAL'))
 
     def __init__(self):
         try:
@@ -76,9 +318,8 @@ class Configuration(object):
         logging.debug('Config: init() called')
         try:
             self.config = {}
-            self.general = Configuration.GeneralConfiguration()
-            self.server = Configuration.ServerConfiguration()
-            self.slave = Configuration.SlaveConfiguration()
+            for name, group in Configuration.groups().items():
+                setattr(self, name, group())
             # read configs
             self._read_config_file()
             self._read_env_vars()
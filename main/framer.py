@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+
+class Framer:
+    """
+    Incremental splitter of Modbus/TCP byte stream into MBAP frames.
+    Frame boundaries are taken from MBAP length field (bytes 4-5), so
+    coalesced, split and pipelined requests are all handled.
+    """
+    header_length = 6  # transaction id, protocol id, length
+    min_length = 2  # unit id + function code
+    max_length = 254  # unit id + 253 bytes of PDU
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # monotonic time first byte of incomplete frame arrived at, None if there is no such frame
+        self.started = None
+        # complete frames held back by backpressure, they are returned first by next feed
+        self.held = []
+
+    def feed(self, data) -> list:
+        """
+        Append received bytes and cut all complete frames out of them.
+        :param data: bytes received from client
+        :return: list of complete frames, incomplete tail is kept for next feed
+        :raises ValueError: if MBAP length field is out of limits
+        """
+        if self.buffer:
+            self.buffer += data
+            data = self.buffer
+        (frames, self.held) = (self.held, [])
+        position = 0
+        available = len(data)
+        while available - position >= Framer.header_length:
+            length = (data[position + 4] << 8) | data[position + 5]
+            if length < Framer.min_length or length > Framer.max_length:
+                self.buffer = bytearray()
+                logging.error(f'Framer: MBAP length out of limits: {length}')
+                raise ValueError(f'Framer: MBAP length out of limits: {length}')
+            end = position + Framer.header_length + length
+            if end > available:
+                break
+            frames.append(bytes(data[position:end]))
+            position = end
+        if data is self.buffer:
+            del self.buffer[:position]
+        elif position < available:
+            self.buffer = bytearray(data[position:])
+        if not self.buffer:
+            self.started = None
+        elif frames or self.started is None:
+            self.started = time.monotonic()
+        return frames
+
+    def hold(self, frames: list):
+        """
+        Keep complete frames which are not dispatched yet, next feed returns them first
+        """
+        self.held = frames
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import socket
+import struct
+import threading
+from socketserver import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+
+from main.memory import Memory
+from main.signals import BIT_TABLES, TABLES
+
+# Messages are length prefixed batches of updates, every batch is acknowledged by a reply.
+# update: unit id, table (index in TABLES), start address, count, then values:
+# 2 bytes per register big-endian, bits packed LSB first as Modbus sends them
+message_header = struct.Struct('>I')
+update_header = struct.Struct('>BBHH')
+# status, number of updates applied
+reply = struct.Struct('>BI')
+max_message = 16 * 1024 * 1024
+
+OK = 0
+MALFORMED = 1
+NOT_SERVED = 2
+OUT_OF_RANGE = 3
+STATUSES = {
+    OK: 'ok',
+    MALFORMED: 'malformed batch',
+    NOT_SERVED: 'unit id is not served',
+    OUT_OF_RANGE: 'address range out of limits',
+}
+
+
+def values_length(table: int, count: int) -> int:
+    return (count + 7) >> 3 if TABLES[table] in BIT_TABLES else count * 2
+
+
+class InjectionServer:
+    """
+    Side channel writing values straight into slave tables, bypassing Modbus request path.
+    Listens on Unix socket from background threads, one per client.
+    """
+    def __init__(self, slaves, path: str):
+        """
+        :param slaves: Slaves updates are applied to
+        :param path: Unix socket path, replaced if it exists
+        """
+        self.slaves = slaves
+        self.path = path
+
+    def apply(self, batch) -> tuple:
+        """
+        Apply updates one by one, stop at the first invalid one
+        :param batch: message body
+        :return: (status, number of updates applied)
+        """
+        view = memoryview(batch)
+        position = 0
+        applied = 0
+        while position < len(view):
+            if len(view) - position < update_header.size:
+                return MALFORMED, applied
+            (unit, table, address, count) = update_header.unpack_from(view, position)
+            position += update_header.size
+            if table >= len(TABLES) or count == 0:
+                return MALFORMED, applied
+            length = values_length(table, count)
+            if len(view) - position < length:
+                return MALFORMED, applied
+            if address + count > Memory.table_size:
+                return OUT_OF_RANGE, applied
+            slave = self.slaves.get(unit)
+            if slave is None:
+                return NOT_SERVED, applied
+            values = view[position:position + length]
+            position += length
+            if table == 0:
+                slave.coils.write(address, count, values)
+            elif table == 1:
+                slave.contacts.write(address, count, values)
+            elif table == 2:
+                slave.input_registers.write(address, values)
+            else:
+                slave.holding_registers.write(address, values)
+            slave.invalidate(TABLES[table], address, count)
+            applied += 1
+        return OK, applied
+
+    def start(self):
+        injection = self
+
+        class Handler(StreamRequestHandler):
+            def handle(self):
+                while True:
+                    header = self.rfile.read(message_header.size)
+                    if len(header) < message_header.size:
+                        return
+                    (length,) = message_header.unpack(header)
+                    if length > max_message:
+                        logging.error(f'Injection: batch of {length} bytes is too long')
+                        self.wfile.write(reply.pack(MALFORMED, 0))
+                        return
+                    batch = self.rfile.read(length)
+                    if len(batch) < length:
+                        return
+                    (status, applied) = injection.apply(batch)
+                    if status != OK:
+                        logging.error(f'Injection: {STATUSES[status]}, {applied} updates applied')
+                    self.wfile.write(reply.pack(status, applied))
+                    self.wfile.flush()
+
+        class ThreadingUnixStreamServer(ThreadingMixIn, UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = ThreadingUnixStreamServer(self.path, Handler)
+        threading.Thread(target=server.serve_forever, name='injection', daemon=True).start()
+        logging.info(f'Injection: listen {self.path}')
+
+
+class InjectionError(Exception):
+    def __init__(self, status: int, applied: int):
+        super().__init__(f'Injection: {STATUSES.get(status, status)}, {applied} updates applied')
+        self.status = status
+        self.applied = applied
+
+
+class Batch:
+    """
+    Updates collected to be sent in one message.
+    """
+    def __init__(self, client=None):
+        self.client = client
+        self.buffer = bytearray()
+        self.count = 0
+
+    def registers(self, unit: int, table: str, address: int, values):
+        """
+        :param table: 'input' or 'holding'
+        :param values: register values as ints, or bytes already big-endian
+        """
+        index = TABLES.index(table)
+        if TABLES[index] in BIT_TABLES:
+            raise ValueError(f'Injection: {table} is not a register table')
+        if not isinstance(values, (bytes, bytearray, memoryview)):
+            values = struct.pack(f'>{len(values)}H', *values)
+        elif len(values) & 0x01:
+            raise ValueError('Injection: register values must be 2 bytes each')
+        self.buffer += update_header.pack(unit, index, address, len(values) // 2)
+        self.buffer += values
+        self.count += 1
+        return self
+
+    def bits(self, unit: int, table: str, address: int, values):
+        """
+        :param table: 'coils' or 'contacts'
+        :param values: sequence of bools
+        """
+        index = TABLES.index(table)
+        if TABLES[index] not in BIT_TABLES:
+            raise ValueError(f'Injection: {table} is not a bit table')
+        packed = sum(1 << i for i, value in enumerate(values) if value)
+        self.buffer += update_header.pack(unit, index, address, len(values))
+        self.buffer += packed.to_bytes((len(values) + 7) >> 3, byteorder='little')
+        self.count += 1
+        return self
+
+    def send(self) -> int:
+        """
+        :return: number of updates applied
+        :raises InjectionError: if emulator rejected an update
+        """
+        try:
+            return self.client.send(self)
+        finally:
+            self.buffer = bytearray()
+            self.count = 0
+
+
+class InjectionClient:
+    """
+    Client of InjectionServer.
+    Example:
+        client = InjectionClient('/tmp/modbus-inject.sock')
+        client.batch().registers(1, 'input', 0, [1, 2, 3]).bits(1, 'coils', 10, [True, False]).send()
+    """
+    def __init__(self, path: str):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+
+    def batch(self) -> Batch:
+        return Batch(self)
+
+    def send(self, batch: Batch) -> int:
+        self.socket.sendall(message_header.pack(len(batch.buffer)) + batch.buffer)
+        data = b''
+        while len(data) < reply.size:
+            chunk = self.socket.recv(reply.size - len(data))
+            if not chunk:
+                raise ConnectionError('Injection: connection closed by emulator')
+            data += chunk
+        (status, applied) = reply.unpack(data)
+        if status != OK:
+            raise InjectionError(status, applied)
+        return applied
+
+    def write_registers(self, unit: int, table: str, address: int, values) -> int:
+        return self.batch().registers(unit, table, address, values).send()
+
+    def write_bits(self, unit: int, table: str, address: int, values) -> int:
+        return self.batch().bits(unit, table, address, values).send()
+
+    def close(self):
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+
+class TokenBucket:
+    """
+    Requests allowance refilled at constant rate up to burst size.
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        """
+        :return: True if request is allowed, one token is spent then
+        """
+        now = time.monotonic()
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1.0:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1.0
+        return True
+
+    def full(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Token buckets by key: client IP or unit id. Buckets are created on first request,
+    full ones are forgotten when there are too many of them, as they are equal to new ones.
+    """
+    prune_threshold = 4096
+
+    def __init__(self, rate: float, burst: float = 0):
+        """
+        :param rate: requests per second
+        :param burst: requests allowed at once, rate (at least 1) if omitted
+        """
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.buckets = {}
+
+    def bucket(self, key) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= RateLimiter.prune_threshold:
+                self.prune()
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def prune(self):
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if not bucket.full()}
+
+    @staticmethod
+    def create(rate: float, burst: float):
+        """
+        :return: RateLimiter or None if rate is not limited
+        """
+        return RateLimiter(rate, burst) if rate > 0 else None
@@ -2,25 +2,186 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
 
 from main.configuration import Configuration
+from main.inject import InjectionServer
+from main.memory import SharedMemory
+from main.rtu import RtuServer
 from main.server import Server
-from main.slave import Slave
+from main.slave import Slaves
+from main import signals
 
 class Entrypoint:
     def __init__(self):
         self.config = Configuration()
+        self.workers = {}
+        # held by reload of master of workers, so workers are not forked from half reloaded configuration
+        self.reloading = threading.Lock()
 
     def main(self):
         try:
-            slaves = []
-            for i in range(self.config.slave.quantity):
-                slaves.append(Slave(address=bytes([i+1])))
-            Server(slaves=slaves).spawn()
+            if self.config.server.transport == 'rtu':
+                if self.config.server.workers > 1:
+                    logging.warning('Entrypoint: RTU line is served by single process, workers setting ignored')
+                    self.config.server.workers = 1
+                slaves = self.create_slaves()
+                self.start_injection(slaves)
+                RtuServer(slaves=slaves).spawn()
+                return
+            if self.config.server.transport != 'tcp':
+                raise Exception(f'unknown transport: {self.config.server.transport}')
+            slaves = self.create_slaves()
+            if self.config.server.workers > 1:
+                self.spawn_workers(slaves)
+            else:
+                self.start_injection(slaves)
+                Server(slaves=slaves).spawn()
         except Exception as e:
             logging.error(f'Entrypoint: {str(e)}')
         pass
 
+    def create_slaves(self) -> Slaves:
+        """
+        Slaves get private memory, unless it must be shared between workers or persisted to state file.
+        Slave objects themselves are created on first request to them.
+        :return: slaves registry
+        """
+        units = self.config.slave.unit_ids()
+        configured_signals = signals.load(self.config.slave.signals)
+        memory = None
+        lock = None
+        if self.config.server.workers > 1:
+            lock = multiprocessing.Lock()
+        elif self.config.server.inject:
+            # bit tables are written by injection threads too
+            lock = threading.Lock()
+        if self.config.server.workers > 1 or self.config.slave.state:
+            # slots for all unit ids, so units can be added by reload; untouched slots take no memory
+            memory = SharedMemory(slots=247, lock=lock, path=self.config.slave.state or None)
+            if memory.path:
+                logging.info(f'Entrypoint: state file {memory.path}, {memory.initialized()} slaves restored')
+        cache_size = self.config.slave.response_cache
+        if cache_size and (self.config.server.workers > 1 or self.config.slave.state):
+            # tables are written by other workers or by state restore too, their writes would not
+            # invalidate cached responses
+            logging.warning('Entrypoint: response cache is disabled, as tables are shared with other processes')
+            cache_size = 0
+        return Slaves(units=units, memory=memory, signals=configured_signals, lock=lock, cache_size=cache_size)
+
+    def start_injection(self, slaves: Slaves):
+        """
+        Injection is served by the process owning slaves: the server itself or master of workers,
+        as their tables are shared
+        """
+        if self.config.server.inject:
+            InjectionServer(slaves, self.config.server.inject).start()
+
+    def watch_configuration(self, slaves: Slaves, requested: threading.Event):
+        """
+        Keep slaves of master of workers in step with reloaded configuration, injection is served from them
+        and respawned workers inherit them. Reload is checked once a second from a background thread.
+        :param requested: set on SIGHUP
+        """
+        def loop():
+            while True:
+                if not requested.wait(1.0) and not self.config.changed():
+                    continue
+                requested.clear()
+                with self.reloading:
+                    changes = self.config.reload()
+                    if not any(change.startswith('slave.') for change in changes):
+                        continue
+                    try:
+                        slaves.update(self.config.slave.unit_ids(), signals.load(self.config.slave.signals))
+                    except Exception as e:
+                        logging.error(f'Entrypoint: slaves are not changed: {str(e)}')
+                        continue
+                logging.info(f'Entrypoint: injection serves {len(slaves)} slaves')
+
+        threading.Thread(target=loop, name='configuration', daemon=True).start()
+
+    def spawn_workers(self, slaves: Slaves):
+        """
+        Fork worker processes serving the same port.
+        Slaves are created before fork in shared memory, so all workers see the same tables.
+        Workers which died are respawned.
+        :param slaves: Slaves backed by SharedMemory
+        :return:
+        """
+
+        def fork(number: int):
+            # respawns fork while configuration and injection threads run, child gets none of them: it must not
+            # inherit configuration reloaded half way or a logging handler locked by them; logging of Python 3.7+
+            # takes care of its locks at fork itself
+            handlers = [] if hasattr(os, 'register_at_fork') else logging.getLogger().handlers
+            with self.reloading:
+                for handler in handlers:
+                    handler.acquire()
+                try:
+                    pid = os.fork()
+                finally:
+                    for handler in handlers:
+                        handler.release()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                # until server takes them over
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+                try:
+                    Server(slaves=slaves, worker=number, tls_context=tls_context).spawn()
+                except Exception as e:
+                    logging.error(f'Worker #{number}: {str(e)}')
+                finally:
+                    os._exit(1)
+            logging.info(f'Entrypoint: worker #{number} started, pid {pid}')
+            self.workers[pid] = number
+
+        reload_requested = threading.Event()
+
+        def forward(signum, frame):
+            if signum == signal.SIGHUP:
+                reload_requested.set()
+            for pid in self.workers:
+                try:
+                    os.kill(pid, signum)
+                except ProcessLookupError:
+                    pass
+
+        def terminate(signum, frame):
+            for pid in self.workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            exit(0)
+
+        # context is created before fork, so TLS sessions issued by one worker are resumed by any other
+        tls_context = Server.create_tls_context(self.config.server) if self.config.server.tls_port else None
+        for number in range(self.config.server.workers):
+            fork(number)
+        # threads of master only, workers get none of them; respawns fork while they run, see fork()
+        self.start_injection(slaves)
+        self.watch_configuration(slaves, reload_requested)
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGINT, terminate)
+        # workers reload configuration themselves, also when config file changes, and profile themselves
+        signal.signal(signal.SIGHUP, forward)
+        signal.signal(signal.SIGUSR1, forward)
+        while True:
+            (pid, status) = os.wait()
+            number = self.workers.pop(pid, None)
+            if number is None:
+                continue
+            logging.error(f'Entrypoint: worker #{number} exited with status {status}, respawning')
+            time.sleep(1)
+            fork(number)
+
 
 def entrypoint():
     Entrypoint().main()
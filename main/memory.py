@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import random
+import struct
+
+
+class BitBank:
+    """
+    Bit-packed table of coils or contacts.
+    Bits are packed LSB first, the same order Modbus puts them on the wire.
+    Several bits share a byte, so writes take the lock if the bank is shared between processes.
+    """
+    def __init__(self, buffer: memoryview, size: int, lock=None):
+        self.buffer = buffer
+        self.size = size
+        self.lock = lock
+
+    def get(self, index: int) -> bool:
+        return bool(self.buffer[index >> 3] & (0x01 << (index & 0x07)))
+
+    def set(self, index: int, state: bool):
+        if self.lock:
+            with self.lock:
+                self._set(index, state)
+        else:
+            self._set(index, state)
+
+    def _set(self, index: int, state: bool):
+        if state:
+            self.buffer[index >> 3] |= 0x01 << (index & 0x07)
+        else:
+            self.buffer[index >> 3] &= ~(0x01 << (index & 0x07)) & 0xFF
+
+    def read(self, index: int, count: int) -> bytes:
+        """
+        Pack a range of bits the way Modbus sends them.
+        :param index: first bit
+        :param count: number of bits
+        :return: ceil(count/8) bytes, unused high bits of the last byte are zero
+        """
+        first = index >> 3
+        last = (index + count + 7) >> 3
+        length = (count + 7) >> 3
+        if not index & 0x07:
+            packed = bytearray(self.buffer[first:last])
+        else:
+            value = int.from_bytes(self.buffer[first:last], byteorder='little') >> (index & 0x07)
+            packed = bytearray(value.to_bytes(last - first, byteorder='little')[:length])
+        if count & 0x07:
+            packed[-1] &= (0x01 << (count & 0x07)) - 1
+        return bytes(packed)
+
+    def write(self, index: int, count: int, values: bytes):
+        """
+        Unpack a range of bits received from Modbus into the bank.
+        :param index: first bit
+        :param count: number of bits
+        :param values: ceil(count/8) bytes packed LSB first
+        """
+        if self.lock:
+            with self.lock:
+                self._write(index, count, values)
+        else:
+            self._write(index, count, values)
+
+    def _write(self, index: int, count: int, values: bytes):
+        shift = index & 0x07
+        first = index >> 3
+        last = (index + count + 7) >> 3
+        mask = ((1 << count) - 1) << shift
+        bits = (int.from_bytes(values, byteorder='little') << shift) & mask
+        current = int.from_bytes(self.buffer[first:last], byteorder='little')
+        self.buffer[first:last] = ((current & ~mask) | bits).to_bytes(last - first, byteorder='little')
+
+    def randomize(self):
+        length = len(self.buffer)
+        self.buffer[:] = random.getrandbits(length * 8).to_bytes(length, byteorder='little')
+
+
+class RegisterBank:
+    """
+    Dense table of 16-bit registers.
+    Values are kept big-endian, so a range of registers is a ready response payload.
+    Whole register writes are single slice assignments, only read-modify-write takes the lock.
+    """
+    def __init__(self, buffer: memoryview, size: int, lock=None):
+        self.buffer = buffer
+        self.size = size
+        self.lock = lock
+
+    def get(self, index: int) -> bytes:
+        return bytes(self.buffer[index * 2:index * 2 + 2])
+
+    def set(self, index: int, value: bytes):
+        self.buffer[index * 2:index * 2 + 2] = value
+
+    def read(self, index: int, count: int) -> memoryview:
+        """
+        :param index: first register
+        :param count: number of registers
+        :return: view on 2*count bytes of the bank, no copy is made
+        """
+        return self.buffer[index * 2:(index + count) * 2]
+
+    def write(self, index: int, values: bytes):
+        """
+        :param index: first register
+        :param values: big-endian register values, 2 bytes per register
+        """
+        self.buffer[index * 2:index * 2 + len(values)] = values
+
+    def mask(self, index: int, and_mask: int, or_mask: int):
+        """
+        Modbus mask write: (current AND and_mask) OR (or_mask AND NOT and_mask)
+        :param index: register
+        :param and_mask: bits to keep
+        :param or_mask: bits to set among the ones not kept
+        """
+        if self.lock:
+            with self.lock:
+                self._mask(index, and_mask, or_mask)
+        else:
+            self._mask(index, and_mask, or_mask)
+
+    def _mask(self, index: int, and_mask: int, or_mask: int):
+        current = int.from_bytes(self.buffer[index * 2:index * 2 + 2], byteorder='big')
+        value = (current & and_mask) | (or_mask & ~and_mask & 0xFFFF)
+        self.buffer[index * 2:index * 2 + 2] = value.to_bytes(2, byteorder='big')
+
+    def randomize(self):
+        length = len(self.buffer)
+        self.buffer[:] = random.getrandbits(length * 8).to_bytes(length, byteorder='little')
+
+
+class Memory:
+    """
+    All four tables of one slave laid out in one contiguous buffer:
+    coils, contacts, input registers and holding registers.
+    """
+    table_size = 9999
+    bits_length = (table_size + 7) // 8
+    registers_length = table_size * 2
+    size = bits_length * 2 + registers_length * 2
+
+    def __init__(self, buffer=None, lock=None, restored=False):
+        """
+        :param buffer: writable buffer of Memory.size bytes, new zeroed one is allocated if omitted
+        :param lock: lock guarding bit tables and register masking if buffer is shared between processes
+        :param restored: buffer is initialized by its owner (restored or shared), it must not be seeded again
+        """
+        self.restored = restored
+        if buffer is None:
+            buffer = bytearray(Memory.size)
+        if len(buffer) != Memory.size:
+            raise ValueError(f'Memory: buffer must be {Memory.size} bytes long')
+        self.buffer = buffer
+        view = memoryview(buffer)
+        offset = 0
+        self.coils = BitBank(view[offset:offset + Memory.bits_length], Memory.table_size, lock)
+        offset += Memory.bits_length
+        self.contacts = BitBank(view[offset:offset + Memory.bits_length], Memory.table_size, lock)
+        offset += Memory.bits_length
+        self.input_registers = RegisterBank(view[offset:offset + Memory.registers_length], Memory.table_size)
+        offset += Memory.registers_length
+        self.holding_registers = RegisterBank(view[offset:offset + Memory.registers_length], Memory.table_size, lock)
+
+    def randomize(self):
+        """
+        Seed coils and registers with random data in bulk.
+        """
+        self.coils.randomize()
+        self.input_registers.randomize()
+        self.holding_registers.randomize()
+
+
+class SharedMemory:
+    """
+    Memory of many slaves in one shared mapping.
+    Mapping is inherited by processes forked after it was created,
+    so writes made by one worker are seen by all others.
+    If state file is given, mapping is backed by it: writes land in the file
+    as they are made and next start maps the same tables back.
+    First page holds header and one flag per unit id telling if its slot was initialized.
+    """
+    # magic, layout version, slots, slot size
+    header = struct.Struct('>4sHHI')
+    header_length = mmap.PAGESIZE
+    flags_offset = 64
+    magic = b'MXIO'
+    version = 1
+
+    def __init__(self, slots: int, lock=None, path: str = None):
+        """
+        :param slots: number of slaves, slot N-1 belongs to slave with address N
+        :param lock: process shared lock for bit tables, e.g. multiprocessing.Lock()
+        :param path: state file, anonymous mapping is used if omitted
+        """
+        self.lock = lock
+        self.path = path
+        if path:
+            (self.mapping, self.slots) = SharedMemory.map_file(path, slots)
+        else:
+            self.slots = slots
+            self.mapping = mmap.mmap(-1, SharedMemory.header_length + Memory.size * slots)
+        self.view = memoryview(self.mapping)[SharedMemory.header_length:]
+
+    @staticmethod
+    def read_header(data: bytes) -> int:
+        """
+        Validate state file header
+        :param data: at least SharedMemory.header.size first bytes of file
+        :return: number of slots in file
+        """
+        (magic, version, slots, slot_size) = SharedMemory.header.unpack_from(data)
+        if magic != SharedMemory.magic or version != SharedMemory.version or slot_size != Memory.size:
+            raise ValueError('SharedMemory: state file layout is not compatible')
+        return slots
+
+    @staticmethod
+    def map_file(path: str, slots: int) -> tuple:
+        """
+        Map state file, creating or growing it if needed
+        :return: (mapping, slots in mapping)
+        """
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = 0
+            if os.fstat(fd).st_size:
+                existing = SharedMemory.read_header(os.pread(fd, SharedMemory.header.size, 0))
+            slots = max(slots, existing)
+            length = SharedMemory.header_length + slots * Memory.size
+            if os.fstat(fd).st_size < length:
+                os.ftruncate(fd, length)
+            os.pwrite(fd, SharedMemory.header.pack(SharedMemory.magic, SharedMemory.version, slots, Memory.size), 0)
+            return mmap.mmap(fd, length), slots
+        finally:
+            os.close(fd)
+
+    def initialized(self) -> int:
+        """
+        :return: number of slots initialized earlier, by another worker or a previous run
+        """
+        return sum(self.mapping[SharedMemory.flags_offset:SharedMemory.flags_offset + self.slots + 1])
+
+    def slot(self, address: int, seed: bool = False) -> Memory:
+        """
+        Slot is initialized once for all workers and runs: seeded with random data if asked
+        :param address: slave address
+        :param seed: fill slot with random data, if it was not initialized yet
+        :return: Memory backed by the slot of this slave
+        """
+        if address < 1 or address > self.slots:
+            raise ValueError(f'SharedMemory: no slot for slave {address}')
+        offset = (address - 1) * Memory.size
+        memory = Memory(self.view[offset:offset + Memory.size], self.lock, restored=True)
+        flag = SharedMemory.flags_offset + address
+        if not self.mapping[flag]:
+            if self.lock:
+                with self.lock:
+                    self.initialize(memory, flag, seed)
+            else:
+                self.initialize(memory, flag, seed)
+        return memory
+
+    def initialize(self, memory: Memory, flag: int, seed: bool):
+        if self.mapping[flag]:
+            return
+        if seed:
+            memory.randomize()
+        self.mapping[flag] = 1
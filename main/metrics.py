@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class Series:
+    """
+    Counters of one (unit id, function code) pair.
+    """
+    __slots__ = ('requests', 'dropped', 'received', 'sent', 'exceptions', 'buckets', 'seconds')
+
+    def __init__(self, buckets: int):
+        self.requests = 0
+        self.dropped = 0
+        self.received = 0
+        self.sent = 0
+        self.exceptions = {}
+        self.buckets = [0] * (buckets + 1)
+        self.seconds = 0.0
+
+
+class Metrics:
+    """
+    Request counters and handler time histograms per unit id and function code,
+    rendered in Prometheus text format.
+    """
+    # upper bounds of handler time histogram buckets, seconds
+    buckets = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+    def __init__(self):
+        self.series = {}
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def connected(self):
+        self.connections += 1
+
+    def disconnected(self):
+        self.connections -= 1
+
+    def observe(self, unit: int, code: int, received: int, response, seconds: float):
+        """
+        Account one handled frame
+        :param unit: slave address
+        :param code: function code of request
+        :param received: request length
+        :param response: response returned by slave, falsy if request was dropped
+        :param seconds: handler time
+        """
+        series = self.series.get((unit, code))
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault((unit, code), Series(len(Metrics.buckets)))
+        series.requests += 1
+        series.received += received
+        series.seconds += seconds
+        series.buckets[bisect_left(Metrics.buckets, seconds)] += 1
+        if not response:
+            series.dropped += 1
+            return
+        series.sent += len(response)
+        if response[7] & 0x80:
+            exception = response[8]
+            series.exceptions[exception] = series.exceptions.get(exception, 0) + 1
+
+    def render(self) -> str:
+        with self.lock:
+            items = sorted(self.series.items())
+        lines = []
+
+        def counter(name: str, description: str, attribute: str):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} counter')
+            for (unit, code), series in items:
+                lines.append(f'{name}{{unit="{unit}",code="{code}"}} {getattr(series, attribute)}')
+
+        counter('modbus_requests_total', 'Requests handled', 'requests')
+        counter('modbus_dropped_total', 'Requests answered by closing connection', 'dropped')
+        counter('modbus_received_bytes_total', 'Request bytes received', 'received')
+        counter('modbus_sent_bytes_total', 'Response bytes sent', 'sent')
+        lines.append('# HELP modbus_exceptions_total Exception responses by exception code')
+        lines.append('# TYPE modbus_exceptions_total counter')
+        for (unit, code), series in items:
+            for exception, count in sorted(series.exceptions.items()):
+                lines.append(f'modbus_exceptions_total{{unit="{unit}",code="{code}",exception="0x{exception:02X}"}} {count}')
+        lines.append('# HELP modbus_handler_seconds Time spent in slave handler')
+        lines.append('# TYPE modbus_handler_seconds histogram')
+        for (unit, code), series in items:
+            labels = f'unit="{unit}",code="{code}"'
+            cumulative = 0
+            for bound, count in zip(Metrics.buckets, series.buckets):
+                cumulative += count
+                lines.append(f'modbus_handler_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'modbus_handler_seconds_bucket{{{labels},le="+Inf"}} {series.requests}')
+            lines.append(f'modbus_handler_seconds_sum{{{labels}}} {series.seconds}')
+            lines.append(f'modbus_handler_seconds_count{{{labels}}} {series.requests}')
+        lines.append('# HELP modbus_active_connections Connected clients')
+        lines.append('# TYPE modbus_active_connections gauge')
+        lines.append(f'modbus_active_connections {self.connections}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int):
+        """
+        Expose metrics on http://0.0.0.0:port/metrics from a background thread
+        :param port: TCP port
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f'Metrics: {self.address_string()} {format % args}')
+
+        class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        http = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        threading.Thread(target=http.serve_forever, name='metrics-http', daemon=True).start()
+        logging.info(f'Metrics: listen 0.0.0.0:{port}')
+
+    def dump(self, path: str, interval: float):
+        """
+        Periodically write metrics to file from a background thread
+        :param path: file is replaced atomically on every dump
+        :param interval: seconds between dumps
+        """
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    with open(f'{path}.tmp', 'w') as file:
+                        file.write(self.render())
+                    os.replace(f'{path}.tmp', path)
+                except OSError as e:
+                    logging.error(f'Metrics: dump error: {str(e)}')
+
+        threading.Thread(target=loop, name='metrics-dump', daemon=True).start()
+        logging.info(f'Metrics: dump to {path} every {interval}s')
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import logging
+import signal
+import threading
+import time
+from os import path
+
+from main.configuration import Configuration
+from main.slave import Slave
+
+
+class CProfileCapture:
+    """
+    Deterministic profile of serving thread, written in pstats format.
+    """
+    extension = 'prof'
+
+    def __init__(self, targets, interval: float):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self, file: str):
+        self.profile.disable()
+        self.profile.dump_stats(file)
+
+
+class SamplingCapture:
+    """
+    Stacks of serving thread sampled by CPU time timer, written as collapsed stacks:
+    frames from root separated by ';', then number of samples. Timer signal interrupts serving thread
+    wherever it runs, a sampling thread would only see it where it releases GIL.
+    """
+    extension = 'folded'
+
+    def __init__(self, targets, interval: float):
+        self.interval = interval
+        self.stacks = {}
+        self.labels = {}
+        self.handler = None
+
+    def start(self):
+        self.handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f'{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})'
+        return label
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self.label(frame.f_code))
+            frame = frame.f_back
+        stack = ';'.join(reversed(stack))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self, file: str):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.handler)
+        with open(file, 'w') as output:
+            for stack, count in sorted(self.stacks.items()):
+                output.write(f'{stack} {count}\n')
+
+
+class StageCapture:
+    """
+    Calls and time of request pipeline stages. Stages are timed by wrappers installed for the window only,
+    they are inclusive: dispatch contains slave, slave contains handler of function code.
+    """
+    extension = 'stages'
+
+    def __init__(self, targets, interval: float):
+        """
+        :param targets: (object or class, attribute, stage) of server callables to time,
+                        Slave.receive and handlers of function codes are timed too
+        """
+        self.targets = list(targets) + [(Slave, 'receive', 'slave')]
+        self.stages = {}
+        self.saved = []
+        self.commands = None
+        self.started = 0.0
+
+    def timed(self, stage: str, function):
+        counters = self.stages.setdefault(stage, [0, 0.0])
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counters[0] += 1
+                counters[1] += clock() - started
+
+        return wrapper
+
+    def start(self):
+        for (owner, name, stage) in self.targets:
+            self.saved.append((owner, name, vars(owner).get(name)))
+            setattr(owner, name, self.timed(stage, getattr(owner, name)))
+        # handlers are looked up in commands on every request, the table is swapped for the window
+        self.commands = Slave.commands
+        Slave.commands = {code: command._replace(handler=self.timed(f'handler 0x{code:02X}', command.handler))
+                          for code, command in self.commands.items()}
+        self.started = time.perf_counter()
+
+    def stop(self, file: str):
+        window = time.perf_counter() - self.started
+        Slave.commands = self.commands
+        for (owner, name, original) in reversed(self.saved):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        with open(file, 'w') as output:
+            output.write(f'# window {window:.3f} s, stages are inclusive\n')
+            output.write(f'{"stage":<16}{"calls":>12}{"seconds":>12}{"mean us":>12}{"window %":>10}\n')
+            for stage, (calls, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+                if not calls:
+                    continue
+                mean = seconds / calls * 1000000 if calls else 0.0
+                output.write(f'{stage:<16}{calls:>12}{seconds:>12.4f}{mean:>12.2f}{seconds / window * 100:>10.1f}\n')
+
+
+class Profiler:
+    """
+    Profiling window of serving thread, requested by SIGUSR1 or by turning `profile.enabled` on.
+    Requests are taken by check from event loop, so captures start and stop in serving thread.
+    Nothing is hooked outside windows.
+    """
+    modes = {
+        'cprofile': CProfileCapture,
+        'sampling': SamplingCapture,
+        'stages': StageCapture,
+    }
+
+    def __init__(self, targets, worker: int = 0):
+        """
+        :param targets: (object or class, attribute, stage) timed by stages mode
+        :param worker: number of worker process, output files are made unique with it
+        """
+        self.targets = targets
+        self.worker = worker
+        self.requested = Configuration().profile.enabled
+        self.capture = None
+        self.file = ''
+        self.deadline = 0.0
+
+    def request(self):
+        self.requested = True
+
+    def check(self):
+        if self.capture and time.monotonic() >= self.deadline:
+            self.stop()
+        if self.requested:
+            self.requested = False
+            if self.capture:
+                logging.warning(f'Profiler: capture to {self.file} is running already')
+            else:
+                self.start()
+
+    def start(self):
+        config = Configuration().profile
+        mode = Profiler.modes.get(config.mode)
+        if mode is None:
+            logging.error(f'Profiler: unknown mode: {config.mode}')
+            return
+        if mode is SamplingCapture and threading.current_thread() is not threading.main_thread():
+            logging.error('Profiler: sampling needs server to run in main thread, signals are delivered there')
+            return
+        base = f'{config.path}.{self.worker}' if self.worker else config.path
+        self.file = f'{base}.{mode.extension}'
+        self.capture = mode(self.targets, config.interval)
+        self.deadline = time.monotonic() + config.duration
+        self.capture.start()
+        logging.info(f'Profiler: {config.mode} capture for {config.duration}s started')
+
+    def stop(self):
+        (capture, self.capture) = (self.capture, None)
+        try:
+            capture.stop(self.file)
+            logging.info(f'Profiler: capture written to {self.file}')
+        except OSError as e:
+            logging.error(f'Profiler: write error: {str(e)}')
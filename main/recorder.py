@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import struct
+import threading
+import time
+from collections import namedtuple
+
+# time: wall clock seconds, session: connection number inside the recording worker,
+# response: empty if request was answered by closing connection
+Record = namedtuple('Record', ('time', 'session', 'unit', 'code', 'request', 'response'))
+
+
+class Recorder:
+    """
+    Append-only binary log of handled frames.
+    File starts with magic and version, then records follow: time, session, unit id, function code,
+    request length, response length, request and response bytes.
+    Frames are packed into memory by serving thread and written to file by background one.
+    """
+    magic = b'MXRL'
+    version = 1
+    header = struct.Struct('>4sH')
+    entry = struct.Struct('>dIBBHH')
+
+    def __init__(self, path: str, interval: float = 0.2):
+        """
+        :param path: log file, replaced if it exists, as replay needs tables state of recording start
+        :param interval: seconds between writes to file
+        """
+        self.path = path
+        self.interval = interval
+        self.file = open(path, 'wb')
+        self.file.write(Recorder.header.pack(Recorder.magic, Recorder.version))
+        self.pending = bytearray()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, name='recorder', daemon=True)
+        self.thread.start()
+        logging.info(f'Recorder: frames are recorded to {path}')
+
+    def record(self, session: int, request: bytes, response):
+        """
+        :param session: connection number
+        :param request: MBAP frame
+        :param response: response sent, falsy if connection was dropped
+        """
+        response = response or b''
+        header = Recorder.entry.pack(time.time(), session, request[6], request[7], len(request), len(response))
+        with self.lock:
+            self.pending += header
+            self.pending += request
+            self.pending += response
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            (pending, self.pending) = (self.pending, bytearray())
+        if pending:
+            try:
+                self.file.write(pending)
+                self.file.flush()
+            except OSError as e:
+                logging.error(f'Recorder: write error: {str(e)}')
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+
+def read_log(path: str):
+    """
+    :param path: file written by Recorder
+    :return: generator of Record
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < Recorder.header.size:
+        raise ValueError(f'Recorder: {path} is not a traffic log')
+    (magic, version) = Recorder.header.unpack_from(data, 0)
+    if magic != Recorder.magic or version != Recorder.version:
+        raise ValueError(f'Recorder: {path} is not a traffic log of version {Recorder.version}')
+    position = Recorder.header.size
+    while position + Recorder.entry.size <= len(data):
+        (moment, session, unit, code, request_length, response_length) = Recorder.entry.unpack_from(data, position)
+        position += Recorder.entry.size
+        end = position + request_length + response_length
+        if end > len(data):
+            logging.warning(f'Recorder: {path} ends with truncated record')
+            break
+        yield Record(moment, session, unit, code, data[position:position + request_length],
+                     data[position + request_length:end])
+        position = end
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import select
+import struct
+import termios
+import tty
+
+from main.configuration import Configuration
+from main.server import Server
+
+
+def _crc_table() -> tuple:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 0x0001 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _crc_table()
+
+
+def crc16(data) -> int:
+    """
+    Modbus CRC16 (polynomial 0xA001, initial 0xFFFF), one table lookup per byte
+    :param data: bytes-like object
+    :return: CRC, goes to the wire low byte first
+    """
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+class RtuServer(Server):
+    """
+    Modbus RTU transport on serial device or pseudo-terminal.
+    Frames are delimited by 3.5 characters of silence, RTU requests are
+    wrapped into MBAP header and served by the same Slave.receive as TCP.
+    """
+    # MBAP: transaction id, protocol id, length, unit id
+    mbap = struct.Struct('>HHHB')
+
+    def __init__(self, slaves, worker=0):
+        self.rtu = Configuration().rtu
+        self.ignore_checksum = self.rtu.ignore_crc
+        self.pty = None
+        super().__init__(slaves, worker)
+        self.interval = RtuServer.silent_interval(self.rtu.baudrate)
+
+    @staticmethod
+    def silent_interval(baudrate: int) -> float:
+        """
+        :return: 3.5 character times in seconds, fixed to 1.75 ms above 19200 baud as spec recommends
+        """
+        if baudrate > 19200:
+            return 0.00175
+        return 3.5 * 11 / baudrate
+
+    def bind(self) -> int:
+        if self.rtu.device:
+            fd = os.open(self.rtu.device, os.O_RDWR | os.O_NOCTTY)
+            RtuServer.configure(fd, self.rtu.baudrate)
+            logging.info(f'Server: RTU on {self.rtu.device} at {self.rtu.baudrate} baud')
+            return fd
+        (fd, self.pty) = os.openpty()
+        tty.setraw(self.pty)
+        tty.setraw(fd)
+        name = os.ttyname(self.pty)
+        if self.rtu.link:
+            if os.path.islink(self.rtu.link):
+                os.unlink(self.rtu.link)
+            os.symlink(name, self.rtu.link)
+        logging.info(f'Server: RTU on pseudo-terminal {name}' + (f' linked as {self.rtu.link}' if self.rtu.link else ''))
+        return fd
+
+    @staticmethod
+    def configure(fd: int, baudrate: int):
+        """
+        Raw 8N1 mode with asked baud rate
+        """
+        speed = getattr(termios, f'B{baudrate}', None)
+        if speed is None:
+            raise Exception(f'Server: baud rate is not supported: {baudrate}')
+        tty.setraw(fd)
+        attributes = termios.tcgetattr(fd)
+        attributes[2] = (attributes[2] & ~(termios.PARENB | termios.CSTOPB | termios.CSIZE)) | termios.CS8 | \
+            termios.CLOCAL | termios.CREAD
+        attributes[4] = speed
+        attributes[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attributes)
+
+    def answer(self, frame: bytes):
+        """
+        Serve one RTU frame
+        :param frame: unit id, PDU and CRC
+        :return: RTU response or None if nothing must be sent
+        """
+        if len(frame) < 4:
+            logging.error(f'Server: RTU frame too short: {frame.hex()}')
+            return None
+        if not self.ignore_checksum and crc16(frame[:-2]) != (frame[-2] | (frame[-1] << 8)):
+            logging.error(f'Server: RTU CRC mismatch: {frame.hex()}')
+            return None
+        unit = frame[0]
+        pdu = frame[1:-2]
+        # recorded as MBAP frames of one session, so the log is replayed over TCP
+        process = self.record if self.recorder else self.process
+        if unit == 0:
+            # broadcast: every slave executes request, nobody answers
+            for address in sorted(self.slaves.units):
+                process(RtuServer.mbap.pack(0, 0, len(pdu) + 1, address) + pdu)
+            return None
+        if unit not in self.slaves:
+            # request to another device on the bus
+            return None
+        response = process(RtuServer.mbap.pack(0, 0, len(pdu) + 1, unit) + pdu)
+        if not response:
+            return None
+        response = bytearray(response[6:])
+        crc = crc16(response)
+        response += bytes([crc & 0xFF, crc >> 8])
+        return response
+
+    def spawn(self):
+        self.watch_configuration()
+        try:
+            self.serve_line()
+        finally:
+            if self.recorder:
+                self.recorder.close()
+
+    def serve_line(self):
+        fd = self.socket
+        frame = bytearray()
+        while True:
+            (readable, _, _) = select.select([fd], [], [], self.interval if frame else 1.0)
+            if readable:
+                frame += os.read(fd, 4096)
+                continue
+            if not frame:
+                self.check_reload()
+                continue
+            # silent interval elapsed - frame is complete
+            logging.debug(f'Server: RTU received: {frame.hex()}')
+            response = self.answer(bytes(frame))
+            frame.clear()
+            if response:
+                logging.debug(f'Server: RTU response: {response.hex()}')
+                view = memoryview(response)
+                while view:
+                    view = view[os.write(fd, view):]
@@ -1,70 +1,681 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
+import functools
+import itertools
 import logging
+import selectors
+import signal
 import socket
+import ssl
+import sys
+import threading
+import time
 
+from main import signals
 from main.configuration import Configuration
+from main.framer import Framer
+from main.limits import RateLimiter
+from main.metrics import Metrics
+from main.profiler import Profiler
+from main.recorder import Recorder
+
+
+class Connection:
+    """
+    State of one client connection served by selectors engine.
+    """
+    buffer_size = 12228
+
+    def __init__(self, client: socket.socket, address, session=0):
+        self.client = client
+        self.address = address
+        self.session = session
+        self.buffer = bytearray(self.buffer_size)
+        self.view = memoryview(self.buffer)
+        self.framer = Framer()
+        self.outgoing = bytearray()
+        self.events = selectors.EVENT_READ
+        self.last_activity = time.monotonic()
+
+    def read(self):
+        """
+        Read available bytes into connection buffer.
+        :return: memoryview of received bytes, empty one if peer disconnected
+        """
+        received = self.client.recv_into(self.buffer)
+        self.last_activity = time.monotonic()
+        return self.view[:received]
+
+    def write(self, response: bytes) -> bool:
+        """
+        Send response or queue it until socket become writable.
+        :param response: bytes to send
+        :return: True if all bytes were sent
+        """
+        self.outgoing += response
+        return self.flush()
+
+    def flush(self) -> bool:
+        """
+        Send as much of queued bytes as socket accepts.
+        :return: True if nothing left in queue
+        """
+        try:
+            sent = self.client.send(self.outgoing)
+            del self.outgoing[:sent]
+            if sent:
+                # client reading responses is alive even if it sends nothing while backpressure holds it
+                self.last_activity = time.monotonic()
+        except (BlockingIOError, InterruptedError, ssl.SSLWantWriteError, ssl.SSLWantReadError):
+            pass
+        return not self.outgoing
+
+    def close(self):
+        try:
+            self.client.close()
+        except OSError:
+            pass
+
+
+class TlsConnection(Connection):
+    """
+    Connection of Modbus/TCP Security client, handshake is made on first readiness to read.
+    """
+    # one TLS record carries up to 16 KiB, reading it whole leaves nothing pending inside SSL object,
+    # so selector readiness is enough to know there is more to read
+    buffer_size = 16384
+
+    def __init__(self, client: ssl.SSLSocket, address, session=0):
+        super().__init__(client, address, session)
+        self.handshaken = False
+
+    def read(self):
+        """
+        :raises ssl.SSLWantReadError: if handshake or record is not complete yet
+        """
+        if not self.handshaken:
+            # server flight of handshake is a few KiB, it fits into send buffer of a new socket
+            self.client.do_handshake()
+            self.handshaken = True
+            self.last_activity = time.monotonic()
+        return super().read()
+
+
+class Protocol(asyncio.Protocol):
+    """
+    Client connection served by asyncio engine.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.address = None
+        self.session = next(server.sessions)
+        self.framer = Framer()
+        self.last_activity = time.monotonic()
+        self.idle_handle = None
+        self.read_handle = None
+        self.accepted = False
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.address = transport.get_extra_info('peername')
+        config = self.server.config
+        if 0 < config.max_connections <= self.server.connections:
+            logging.warning(f'Server: too many connections, rejecting {str(self.address)}')
+            transport.close()
+            return
+        self.accepted = True
+        self.server.connections += 1
+        logging.debug(f'Server: connection from {str(self.address)}')
+        if self.server.metrics:
+            self.server.metrics.connected()
+        if config.output_limit > 0:
+            transport.set_write_buffer_limits(high=config.output_limit)
+        self.schedule_idle_check()
+
+    def connection_lost(self, exc):
+        if not self.accepted:
+            return
+        self.server.connections -= 1
+        logging.debug(f'Server: connection closed {str(self.address)}')
+        if self.server.metrics:
+            self.server.metrics.disconnected()
+        if self.idle_handle:
+            self.idle_handle.cancel()
+        if self.read_handle:
+            self.read_handle.cancel()
+
+    def pause_writing(self):
+        # backpressure: responses are not read by client, stop reading its requests
+        self.paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.paused = False
+        self.last_activity = time.monotonic()
+        if self.framer.started is not None:
+            # incomplete frame was waiting for us, not for client
+            self.framer.started = self.last_activity
+        self.transport.resume_reading()
+        if self.framer.held:
+            self.dispatch(b'')
+
+    def schedule_idle_check(self):
+        if self.server.config.idle_timeout > 0:
+            self.idle_handle = asyncio.get_event_loop().call_later(self.server.config.idle_timeout,
+                                                                   self.idle_check)
+
+    def idle_check(self):
+        idle = time.monotonic() - self.last_activity
+        if idle >= self.server.config.idle_timeout:
+            logging.info(f'Server: idle timeout, closing {str(self.address)}')
+            self.transport.close()
+        else:
+            self.idle_handle = asyncio.get_event_loop().call_later(self.server.config.idle_timeout - idle,
+                                                                   self.idle_check)
+
+    def read_check(self):
+        self.read_handle = None
+        if self.framer.started is None:
+            return
+        waiting = 0.0 if self.paused else time.monotonic() - self.framer.started
+        if waiting >= self.server.config.read_timeout:
+            logging.info(f'Server: read timeout, closing {str(self.address)}')
+            self.transport.close()
+        else:
+            self.read_handle = asyncio.get_event_loop().call_later(self.server.config.read_timeout - waiting,
+                                                                   self.read_check)
+
+    def data_received(self, data: bytes):
+        self.last_activity = time.monotonic()
+        self.dispatch(data)
+
+    def dispatch(self, data):
+        """
+        Answer frames of received data and the ones held back before, until client stops taking responses
+        """
+        while True:
+            room = self.server.output_room(self.transport.get_write_buffer_size())
+            (response, keep) = self.server.handle(self.framer, data, self.address[0], self.session, room)
+            if response:
+                logging.debug(f'Server: response: {response.hex()}')
+                self.transport.write(response)
+            if not keep:
+                self.transport.close()
+                return
+            if self.paused or not self.framer.held:
+                break
+            data = b''
+        if self.framer.started is not None and self.read_handle is None and self.server.config.read_timeout > 0:
+            self.read_handle = asyncio.get_event_loop().call_later(self.server.config.read_timeout, self.read_check)
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Modbus/UDP served by asyncio engine, every datagram carries one MBAP frame.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, address):
+        response = self.server.process_datagram(data, address)
+        if response:
+            self.transport.sendto(response, address)
 
 
 class Server:
-    def __init__(self, slaves):
+    # datagrams read in a row on one readiness of UDP socket
+    datagram_batch = 64
+
+    def __init__(self, slaves, worker=0, tls_context=None):
+        """
+        :param slaves: Slaves served
+        :param worker: number of worker process, metrics port and file are made unique with it
+        :param tls_context: SSLContext shared by workers, created here if TLS is enabled and it is omitted
+        """
         if not len(slaves):
             raise Exception('Server: no slaves passed')
         self.slaves = slaves
         self.config = Configuration().server
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.bind(('0.0.0.0', self.config.port))
-        logging.info(f'Server: listen 0.0.0.0:{self.config.port}')
+        self.metrics = self.create_metrics(Configuration().metrics, worker)
+        limits = Configuration().limits
+        # token buckets are kept per worker process
+        self.client_limits = RateLimiter.create(limits.client_rate, limits.burst)
+        self.unit_limits = RateLimiter.create(limits.unit_rate, limits.burst)
+        self.connections = 0
+        self.sessions = itertools.count(1)
+        self.recorder = self.create_recorder(self.config.record, worker)
+        self.reload_requested = False
+        self.profiler = Profiler(self.profiled_stages(), worker)
+        self.engines = {
+            'selectors': self.spawn_selectors,
+            'asyncio': self.spawn_asyncio
+        }
+        if self.config.engine not in self.engines:
+            raise Exception(f'Server: unknown engine: {self.config.engine}')
+        self.socket = self.bind()
+        self.udp = None
+        self.tls = None
+        self.tls_context = None
+        if self.config.transport == 'tcp':
+            if self.config.udp_port:
+                self.udp = self.bind_socket(self.config.udp_port, socket.SOCK_DGRAM)
+                logging.info(f'Server: listen UDP 0.0.0.0:{self.config.udp_port}')
+            if self.config.tls_port:
+                self.tls_context = tls_context or Server.create_tls_context(self.config)
+                self.tls = self.bind_socket(self.config.tls_port)
+                logging.info(f'Server: listen TLS 0.0.0.0:{self.config.tls_port}')
+
+    def bind_socket(self, port: int, kind=socket.SOCK_STREAM) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, kind)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.config.workers > 1:
+            # every worker binds its own socket, kernel balances connections between them
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('0.0.0.0', port))
+        return sock
+
+    def bind(self) -> socket.socket:
+        sock = self.bind_socket(self.config.port)
+        logging.info(f'Server: listen 0.0.0.0:{self.config.port} ({self.config.engine})')
+        return sock
+
+    @staticmethod
+    def create_tls_context(config) -> ssl.SSLContext:
+        """
+        One context serves all TLS connections: sessions cached by it and its ticket keys let clients
+        resume sessions instead of full handshakes. Created before fork, it is shared by workers too.
+        :param config: server configuration
+        """
+        if not config.tls_cert:
+            raise Exception('Server: TLS certificate is not set')
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.options |= ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1
+        context.load_cert_chain(config.tls_cert, config.tls_key or None)
+        if config.tls_ca:
+            # Modbus/TCP Security asks for mutual authentication
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(config.tls_ca)
+        return context
+
+    @staticmethod
+    def create_metrics(config, worker: int):
+        """
+        Metrics are collected only if they are exposed somewhere
+        :return: Metrics or None
+        """
+        if not config.port and not config.file:
+            return None
+        metrics = Metrics()
+        if config.port:
+            metrics.serve(config.port + worker)
+        if config.file:
+            metrics.dump(f'{config.file}.{worker}' if worker else config.file, config.interval)
+        return metrics
+
+    @staticmethod
+    def create_recorder(path: str, worker: int):
+        """
+        :return: Recorder or None if traffic is not recorded
+        """
+        if not path:
+            return None
+        if threading.current_thread() is threading.main_thread():
+            # let log tail be written on termination
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        return Recorder(f'{path}.{worker}' if worker else path)
+
+    # settings which are applied only on start
+    restart_settings = ('general.debug', 'server.port', 'server.transport', 'server.workers', 'server.engine',
+                        'server.record', 'server.inject', 'server.udp_port', 'server.tls_', 'slave.state',
+                        'slave.response_cache', 'rtu.', 'metrics.')
+
+    def profiled_stages(self) -> list:
+        """
+        :return: (object or class, attribute, stage) of request pipeline callables timed by stages profiling
+        """
+        return [
+            (Connection, 'read', 'recv'),
+            (Connection, 'write', 'send'),
+            (Protocol, 'data_received', 'asyncio callback'),
+            (Framer, 'feed', 'parse'),
+            (self, 'process', 'dispatch'),
+        ]
+
+    def watch_configuration(self):
+        """
+        Reload configuration on SIGHUP and profile on SIGUSR1,
+        requests are checked by check_reload from event loop
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reload_requested', True))
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.profiler.request())
+
+    def check_reload(self):
+        if self.reload_requested or Configuration().changed():
+            self.reload_requested = False
+            self.reload()
+        self.profiler.check()
+
+    def reload(self):
+        """
+        Apply changed configuration. Connections are kept, slave tables are not touched.
+        """
+        changes = Configuration().reload()
+        if not changes:
+            return
+        logging.info(f'Server: configuration reloaded, changed: {", ".join(sorted(changes))}')
+        ignored = sorted(change for change in changes if change.startswith(Server.restart_settings))
+        if ignored:
+            logging.warning(f'Server: restart is needed to apply: {", ".join(ignored)}')
+        if any(change.startswith('slave.') for change in changes):
+            config = Configuration().slave
+            try:
+                self.slaves.update(config.unit_ids(), signals.load(config.signals))
+                logging.info(f'Server: serving {len(self.slaves)} slaves')
+            except ValueError as e:
+                logging.error(f'Server: slaves are not changed: {str(e)}')
+        if any(change.startswith('limits.') for change in changes):
+            limits = Configuration().limits
+            self.client_limits = RateLimiter.create(limits.client_rate, limits.burst)
+            self.unit_limits = RateLimiter.create(limits.unit_rate, limits.burst)
+        if 'profile.enabled' in changes and Configuration().profile.enabled:
+            self.profiler.request()
+
+    def handle(self, framer: Framer, data, client=None, session=0, limit=0) -> tuple:
+        """
+        Process complete frames received so far
+        :param framer: Framer of the connection data came from
+        :param data: Received bytes
+        :param client: IP address of the client, key of its rate limit
+        :param session: number of the connection in traffic log
+        :param limit: bytes of responses after which the rest of frames is held in framer, 0 for no limit
+        :return: (responses joined for a single send, False if client must be disconnected)
+        """
+        logging.debug(f'Server: received: {data.hex()}')
+        try:
+            frames = framer.feed(data)
+        except ValueError:
+            return b'', False
+        process = functools.partial(self.record, session=session) if self.recorder else self.process
+        if len(frames) == 1:
+            response = process(frames[0], client)
+            return (response, True) if response else (b'', False)
+        responses = []
+        size = 0
+        for index, frame in enumerate(frames):
+            response = process(frame, client)
+            if not response:
+                return b''.join(responses), False
+            responses.append(response)
+            size += len(response)
+            if 0 < limit <= size and index + 1 < len(frames):
+                # backpressure: the rest waits until client takes responses
+                framer.hold(frames[index + 1:])
+                break
+        return b''.join(responses), True
+
+    def output_room(self, pending: int) -> int:
+        """
+        :param pending: bytes of responses not taken by client yet
+        :return: limit of handle, at least one frame is answered so that backpressure engages
+        """
+        return self.config.output_limit and max(1, self.config.output_limit - pending)
+
+    def process_datagram(self, data: bytes, address):
+        """
+        :param data: UDP datagram, one whole MBAP frame
+        :param address: sender address
+        :return: response or None if nothing must be sent
+        """
+        if len(data) < 8 or len(data) != Framer.header_length + ((data[4] << 8) | data[5]):
+            logging.error(f'Server: UDP datagram is not one MBAP frame: {bytes(data).hex()}')
+            return None
+        if self.recorder:
+            return self.record(data, address[0])
+        return self.process(data, address[0])
+
+    def record(self, data: bytes, client=None, session=0):
+        """
+        Process frame and append it with its response to traffic log
+        """
+        response = self.process(data, client)
+        self.recorder.record(session, data, response)
+        return response
+
+    def process(self, data: bytes, client=None):
+        """
+        Validate request and pass it to appropriate slave
+        :param data: One MBAP frame
+        :param client: IP address of the client, key of its rate limit
+        :return: response bytes or None if client must be disconnected
+        """
+        if len(data) < 8:
+            logging.error(f'Server: data length < 8: {len(data)}')
+            return None
+        slave_address = int(data[6])
+        slave = self.slaves.get(slave_address)
+        if slave is None:
+            logging.error(f'Server: slave_address is not served: {slave_address}')
+            return None
+        if (self.client_limits and not self.client_limits.bucket(client).take()) or \
+                (self.unit_limits and not self.unit_limits.bucket(slave_address).take()):
+            logging.debug(f'Server: rate limit exceeded by {client} for unit {slave_address}')
+            # server device busy - client is expected to retry later
+            response = slave.exception(data, data[7], 0x06)
+            if self.metrics:
+                self.metrics.observe(slave_address, data[7], len(data), response, 0.0)
+            return response
+        # slave address is served - trying to receive parcel
+        try:
+            if not self.metrics:
+                return slave.receive(slave_address=slave_address, data=data)
+            started = time.perf_counter()
+            response = slave.receive(slave_address=slave_address, data=data)
+            self.metrics.observe(slave_address, data[7], len(data), response, time.perf_counter() - started)
+            return response
+        except Exception as e:
+            logging.error(f'Server: {str(e)}')
+            return None
 
     def spawn(self):
-        def answer_to_client(s: socket.socket, response=None, disconnect=False):
+        self.watch_configuration()
+        try:
+            self.engines[self.config.engine]()
+        finally:
+            if self.recorder:
+                self.recorder.close()
+
+    def spawn_selectors(self):
+        selector = selectors.DefaultSelector()
+        connections = {}
+
+        def disconnect(connection: Connection):
+            logging.debug(f'Server: connection closed {str(connection.address)}')
+            if self.metrics:
+                self.metrics.disconnected()
+            selector.unregister(connection.client)
+            connections.pop(connection.client.fileno(), None)
+            connection.close()
+
+        def events(connection: Connection) -> int:
+            if not connection.outgoing:
+                return selectors.EVENT_READ
+            if 0 < self.config.output_limit <= len(connection.outgoing):
+                # backpressure: requests are not read until client takes its responses
+                return selectors.EVENT_WRITE
+            return selectors.EVENT_READ | selectors.EVENT_WRITE
+
+        def update(connection: Connection):
+            wanted = events(connection)
+            if wanted != connection.events:
+                if wanted & ~connection.events & selectors.EVENT_READ and connection.framer.started is not None:
+                    # incomplete frame was waiting for us, not for client
+                    connection.framer.started = time.monotonic()
+                connection.events = wanted
+                selector.modify(connection.client, wanted, connection)
+
+        def accept(listener: socket.socket):
             try:
+                (client, address) = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            if 0 < self.config.max_connections <= len(connections):
+                logging.warning(f'Server: too many connections, rejecting {str(address)}')
+                client.close()
+                return
+            logging.debug(f'Server: connection from {str(address)}')
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if listener is self.tls:
+                client = self.tls_context.wrap_socket(client, server_side=True, do_handshake_on_connect=False)
+                connection = TlsConnection(client, address, next(self.sessions))
+            else:
+                connection = Connection(client, address, next(self.sessions))
+            connections[client.fileno()] = connection
+            if self.metrics:
+                self.metrics.connected()
+            selector.register(client, selectors.EVENT_READ, connection)
+
+        def dispatch(connection: Connection, data) -> bool:
+            """
+            Answer frames of received data and the ones held back before, until output limit is reached
+            :return: False if connection was closed
+            """
+            while True:
+                (response, keep) = self.handle(connection.framer, data, connection.address[0], connection.session,
+                                               self.output_room(len(connection.outgoing)))
                 if response:
                     logging.debug(f'Server: response: {response.hex()}')
-                    s.sendall(response)
-                if disconnect:
-                    s.close()
-            except:
-                pass
-            #
-        self.socket.listen(1)
-        (client, address) = (None, None)
-        while True:
+                    try:
+                        connection.write(response)
+                        update(connection)
+                    except OSError as e:
+                        logging.error(f'Server: {str(e)}')
+                        keep = False
+                if not keep:
+                    disconnect(connection)
+                    return False
+                if not connection.framer.held or not connection.events & selectors.EVENT_READ:
+                    return True
+                data = b''
+
+        def serve(connection: Connection, mask: int):
+            if mask & selectors.EVENT_WRITE:
+                try:
+                    connection.flush()
+                except OSError as e:
+                    logging.error(f'Server: {str(e)}')
+                    disconnect(connection)
+                    return
+                update(connection)
+                if connection.framer.held and connection.events & selectors.EVENT_READ and \
+                        not dispatch(connection, b''):
+                    return
+            if not mask & selectors.EVENT_READ or not connection.events & selectors.EVENT_READ:
+                return
             try:
-                if not client:
-                    (client, address) = self.socket.accept()
-                logging.debug(f'Server: request from {str(address)}')
-                data = client.recv(12228)
-                logging.debug(f'Server: received: {data.hex()}')
-                if not data or data == b'' or data == b'\0':
-                    logging.error(f'Server: no data was received: {slave_address}')
-                    answer_to_client(client, disconnect=True)
-                    client = None
-                    continue
-                elif len(data) < 8:
-                    logging.error(f'Server: data length < 8: {len(data)}')
-                    answer_to_client(client, disconnect=True)
-                    client = None
-                    continue
-                slave_address = int(data[6])
-                if slave_address == 0 or slave_address > len(self.slaves) or not slave_address:
-                    logging.error(f'Server: slave_address out of range: {slave_address}')
-                    answer_to_client(client, disconnect=True)
-                    client = None
-                    continue
-                # slave address is in limits - trying to receive parcel
-                response = self.slaves[slave_address - 1].receive(
-                    slave_address=slave_address,
-                    data=data
-                )
-                if not response:
-                    answer_to_client(client, disconnect=True)
-                    client = None
-                else:
-                    answer_to_client(client, response)
-            except Exception as e:
+                data = connection.read()
+            except (BlockingIOError, InterruptedError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return
+            except OSError as e:
                 logging.error(f'Server: {str(e)}')
-                answer_to_client(client, disconnect=True)
-                client = None
-        pass
+                disconnect(connection)
+                return
+            if not data:
+                disconnect(connection)
+                return
+            dispatch(connection, data)
+
+        buffer = bytearray(Framer.header_length + Framer.max_length + 1)
+        view = memoryview(buffer)
+
+        def receive_datagrams():
+            # no recvmmsg in Python: datagrams are drained in a row, one select call serves the whole batch
+            for _ in range(Server.datagram_batch):
+                try:
+                    (received, address) = self.udp.recvfrom_into(buffer)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError as e:
+                    logging.error(f'Server: UDP: {str(e)}')
+                    return
+                response = self.process_datagram(bytes(view[:received]), address)
+                if response:
+                    try:
+                        self.udp.sendto(response, address)
+                    except OSError as e:
+                        # UDP gives no delivery guarantee, response is dropped as if lost on the way
+                        logging.debug(f'Server: UDP: {str(e)}')
+
+        def close_expired():
+            now = time.monotonic()
+            for connection in list(connections.values()):
+                if self.config.idle_timeout > 0 and connection.last_activity < now - self.config.idle_timeout:
+                    logging.info(f'Server: idle timeout, closing {str(connection.address)}')
+                    disconnect(connection)
+                elif self.config.read_timeout > 0 and connection.framer.started is not None and \
+                        connection.events & selectors.EVENT_READ and \
+                        connection.framer.started < now - self.config.read_timeout:
+                    logging.info(f'Server: read timeout, closing {str(connection.address)}')
+                    disconnect(connection)
+
+        for listener in (self.socket, self.tls):
+            if listener:
+                listener.listen(socket.SOMAXCONN)
+                listener.setblocking(False)
+                selector.register(listener, selectors.EVENT_READ)
+        if self.udp:
+            self.udp.setblocking(False)
+            selector.register(self.udp, selectors.EVENT_READ)
+        # once a second at least, configuration reload is checked on sweep too
+        timeouts = [timeout for timeout in (self.config.idle_timeout, self.config.read_timeout) if timeout > 0]
+        sweep_interval = min(timeouts + [1.0])
+        next_sweep = time.monotonic()
+        while True:
+            for key, mask in selector.select(timeout=sweep_interval):
+                if key.data:
+                    serve(key.data, mask)
+                elif key.fileobj is self.udp:
+                    receive_datagrams()
+                else:
+                    accept(key.fileobj)
+            if time.monotonic() >= next_sweep:
+                close_expired()
+                self.check_reload()
+                next_sweep = time.monotonic() + sweep_interval
+
+    def spawn_asyncio(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.socket.listen(socket.SOMAXCONN)
+        self.socket.setblocking(False)
+        server = loop.run_until_complete(loop.create_server(lambda: Protocol(self), sock=self.socket))
+        servers = [server]
+        if self.tls:
+            self.tls.listen(socket.SOMAXCONN)
+            self.tls.setblocking(False)
+            servers.append(loop.run_until_complete(
+                loop.create_server(lambda: Protocol(self), sock=self.tls, ssl=self.tls_context)))
+        if self.udp:
+            self.udp.setblocking(False)
+            loop.run_until_complete(loop.create_datagram_endpoint(lambda: DatagramProtocol(self), sock=self.udp))
+
+        def watch():
+            self.check_reload()
+            loop.call_later(1.0, watch)
+
+        loop.call_later(1.0, watch)
+        try:
+            loop.run_forever()
+        finally:
+            for server in servers:
+                server.close()
+                loop.run_until_complete(server.wait_closed())
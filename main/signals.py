@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import math
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+from main.configuration import parse_units
+
+TABLES = ('coils', 'contacts', 'input', 'holding')
+BIT_TABLES = ('coils', 'contacts')
+# b'\x00' -> b'0', b'\x01' -> b'1', used to pack 0/1 flags with int(..., 2)
+_FLAGS_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+def pack_flags(flags) -> bytes:
+    """
+    Pack sequence of 0/1 bytes into Modbus bit order, LSB first
+    """
+    digits = bytes(flags).translate(_FLAGS_TO_DIGITS)[::-1]
+    return int(digits, 2).to_bytes((len(flags) + 7) >> 3, byteorder='little')
+
+
+class Signal:
+    """
+    Generated values of a block of registers or bits.
+    One period of the waveform is precomputed as a timeline of samples, every element of the block
+    reads it at its own phase offset, so memory does not grow with the block.
+    """
+    samples = 1000
+    noise_samples = 4096
+
+    def __init__(self, definition: dict):
+        """
+        :param definition: one item of `signals` configuration list
+        """
+        self.table = str(definition.get('table', 'input'))
+        if self.table not in TABLES:
+            raise ValueError(f'Signal: unknown table: {self.table}')
+        self.kind = str(definition.get('type', 'sine'))
+        self.units = parse_units(definition.get('units'))
+        self.address = int(definition.get('address', 0))
+        self.count = int(definition.get('count', 1))
+        self.period = float(definition.get('period', 60.0))
+        bits = self.table in BIT_TABLES
+        self.minimum = float(definition.get('min', 0))
+        self.maximum = float(definition.get('max', 1 if bits else 0xFFFF))
+        timeline = self.timeline(definition)
+        if bits:
+            middle = (self.minimum + self.maximum) / 2
+            samples = array('B', [1 if value >= middle else 0 for value in timeline])
+        else:
+            samples = array('H', [min(0xFFFF, max(0, int(round(value)))) for value in timeline])
+            if sys.byteorder == 'little':
+                samples.byteswap()  # keep samples big-endian, as banks do
+        self.length = len(samples)
+        # two periods, so that phase plus offset never wraps
+        self.samples = samples * 2
+        # samples between neighbour elements of the block
+        if self.kind == 'noise' and 'spread' not in definition:
+            step = 7919 % self.length
+        else:
+            step = float(definition.get('spread', 0.0)) * self.length / self.count
+        self.offsets = [int(round(index * step)) % self.length for index in range(self.count)]
+        self.shifted = any(self.offsets)
+        # shifted elements index samples one by one, list items are read faster than array ones
+        self.timeline = self.samples.tolist() if self.shifted else None
+        # ((phase, first, count), values) of the last read, polling repeats it until the phase moves
+        self.last = None
+
+    def timeline(self, definition: dict) -> list:
+        low, high = self.minimum, self.maximum
+        n = Signal.samples
+        if self.kind == 'sine':
+            return [low + (high - low) * (1 + math.sin(2 * math.pi * i / n)) / 2 for i in range(n)]
+        if self.kind == 'ramp':
+            return [low + (high - low) * i / (n - 1) for i in range(n)]
+        if self.kind == 'step':
+            return [low] * (n // 2) + [high] * (n - n // 2)
+        if self.kind == 'noise':
+            generator = random.Random(int(definition.get('seed', 0)))
+            return [generator.uniform(low, high) for _ in range(Signal.noise_samples)]
+        if self.kind == 'counter':
+            values = list(range(int(low), int(high) + 1))
+            rate = float(definition.get('rate', 1.0))
+            self.period = len(values) / rate
+            return values
+        if self.kind == 'csv':
+            values = Signal.read_csv(definition['path'], definition.get('column', 0))
+            rate = float(definition.get('rate', 1.0))
+            self.period = len(values) / rate
+            return values
+        raise ValueError(f'Signal: unknown type: {self.kind}')
+
+    @staticmethod
+    def read_csv(path: str, column) -> list:
+        with open(path, newline='') as file:
+            rows = list(csv.reader(file))
+        if isinstance(column, str) and not column.isdigit():
+            index = rows[0].index(column)
+            rows = rows[1:]
+        else:
+            index = int(column)
+            if rows and not Signal.is_number(rows[0][index]):
+                rows = rows[1:]
+        values = [float(row[index]) for row in rows if len(row) > index and row[index] != '']
+        if not values:
+            raise ValueError(f'Signal: no values in {path}')
+        return values
+
+    @staticmethod
+    def is_number(value: str) -> bool:
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+
+    def values(self, now: float, first: int, count: int):
+        """
+        :param now: wall clock, so all workers agree on values
+        :param first: offset of first asked element inside the block
+        :param count: number of elements
+        :return: big-endian register values or 0/1 flags of bits
+        """
+        start = int(now * self.length / self.period) % self.length
+        key = (start, first, count)
+        last = self.last
+        if last is not None and last[0] == key:
+            return last[1]
+        if not self.shifted:
+            values = self.samples[start:start + 1] * count
+        else:
+            timeline = self.timeline
+            values = array(self.samples.typecode, [timeline[start + offset] for offset in self.offsets[first:first + count]])
+        self.last = (key, values)
+        return values
+
+
+class Signals:
+    """
+    Signals of one slave. They are evaluated lazily: only when a read touches them
+    and only for the asked part of the block, right before bank is read.
+    """
+    def __init__(self, signals: list):
+        self.tables = {}
+        for signal in sorted(signals, key=lambda item: item.address):
+            self.tables.setdefault(signal.table, []).append(signal)
+        self.starts = {table: [signal.address for signal in items] for table, items in self.tables.items()}
+
+    def __bool__(self):
+        return bool(self.tables)
+
+    def refresh(self, table: str, bank, index: int, count: int):
+        """
+        Write current values of signals overlapping [index, index + count) into bank
+        :param table: one of TABLES
+        :param bank: BitBank or RegisterBank of the table
+        """
+        signals = self.tables.get(table)
+        if not signals:
+            return
+        now = time.time()
+        end = index + count
+        for signal in signals[:bisect_right(self.starts[table], end - 1)]:
+            first = max(index, signal.address)
+            last = min(end, signal.address + signal.count)
+            if first >= last:
+                continue
+            values = signal.values(now, first - signal.address, last - first)
+            if table in BIT_TABLES:
+                bank.write(first, last - first, pack_flags(values))
+            else:
+                bank.write(first, values.tobytes())
+
+    def overlaps(self, table: str, index: int, count: int) -> bool:
+        """
+        :return: True if some signal generates values of [index, index + count) of table
+        """
+        signals = self.tables.get(table)
+        if not signals:
+            return False
+        end = index + count
+        return any(signal.address + signal.count > index
+                   for signal in signals[:bisect_right(self.starts[table], end - 1)])
+
+
+def load(definitions: list) -> list:
+    """
+    Build signals from `signals` configuration list, broken definitions are skipped
+    :return: list of Signal
+    """
+    signals = []
+    for definition in definitions or []:
+        try:
+            signals.append(Signal(definition))
+        except (ValueError, KeyError, OSError) as e:
+            logging.error(f'Signals: definition {definition} skipped: {str(e)}')
+    return signals
@@ -2,317 +2,428 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import socket
 import random
-from math import ceil
+import struct
+from collections import namedtuple
 
+from main.cache import READ_CODES, ResponseCache
 from main.configuration import Configuration
+from main.memory import Memory
+from main.signals import Signals
+
+# handler: Slave method called with (request, address, quantity) already decoded
+# max_quantity: upper limit of quantity field, None if the field carries a value to write,
+#               0 if request has no address and quantity fields and handler decodes it itself
+# length: minimal request length, MBAP header included
+Command = namedtuple('Command', ('handler', 'max_quantity', 'length'))
+
+
+def identification_responses(objects: tuple, conformity: int) -> dict:
+    """
+    Precompute Read Device Identification PDUs, all objects fit into one response
+    :param objects: values of objects 0x00..0x06: basic ones first, then regular ones
+    :param conformity: conformity level reported by device
+    :return: (read device id code, object id) -> PDU
+    """
+    def pdu(code: int, ids: range) -> bytes:
+        body = b''.join(struct.pack('>BB', index, len(objects[index])) + objects[index] for index in ids)
+        return struct.pack('>BBBBBBB', 0x2B, 0x0E, code, conformity, 0x00, 0x00, len(ids)) + body
+
+    # stream access: basic objects 0..2, regular and extended ones 0..6, extended ones are not defined
+    last = {0x01: 0x02, 0x02: 0x06, 0x03: 0x06}
+    responses = {}
+    for code, end in last.items():
+        for first in range(end + 1):
+            responses[(code, first)] = pdu(code, range(first, end + 1))
+    # individual access
+    for index in range(len(objects)):
+        responses[(0x04, index)] = pdu(0x04, range(index, index + 1))
+    return responses
+
 
 class Slave:
-    def __init__(self, address: bytes):
+    # unit id, function code, address, quantity (or value) - common part of all supported requests
+    request = struct.Struct('>BBHH')
+    # length, unit id, function code, byte count - written right after transaction and protocol ids
+    read_header = struct.Struct('>HBBB')
+    read_header_length = 9
+    # length, unit id, function code, exception code
+    exception_header = struct.Struct('>HBBB')
+    # FC22 OR mask and FC23 write address, write quantity, byte count, following the common part
+    mask_request = struct.Struct('>H')
+    write_request = struct.Struct('>HHB')
+    # length, unit id - prepended to precomputed PDUs
+    pdu_header = struct.Struct('>HB')
+    # VendorName, ProductCode, MajorMinorRevision, VendorUrl, ProductName, ModelName, UserApplicationName
+    identification = identification_responses((
+        b'Yuriy Vlasov',
+        b'modbus-slave',
+        b'1.0',
+        b'https://gitlab.com/vlasov-y/modbus-slave-emulator',
+        b'Modbus slave emulator',
+        b'modbus-slave',
+        b'modbus-slave',
+    ), conformity=0x82)
+
+    def __init__(self, address: bytes, memory: Memory = None, signals=(), cache_size: int = 0, lock=None):
         """
         This slave unique address
         :param address: 1 byte address
+        :param memory: tables storage, private one is allocated if omitted
+        :param signals: configured signals, the ones for this address are taken
+        :param cache_size: read responses cached at most, 0 to not cache
+        :param lock: lock guarding response cache if tables are written by injection threads too
         """
-        self.ignore_checksum = Configuration().general.debug
-        self.config = Configuration().slave
+        config = Configuration()
+        self.config = config.slave
         if len(address) != 1:
             raise ValueError('Slave: address should be an array with one byte')
         self.address = int(address[0])
         if self.address < 1 or self.address > 247:
             raise ValueError('Slave: address must be in limits [1; 247]')
         self.socket = None
-        self.contacts = {}
-        self.coils = {}
-        self.registers = {}
-        self.commands = {
-            1: self.read_discrete_output_coils,
-            2: self.read_discrete_input_contacts,
-            3: self.read_analog_output_holding_registers,
-            4: self.read_analog_input_registers,
-            5: self.write_single_discrete_output_coil,
-            6: self.write_single_analog_output_holding_register,
-            15: self.write_multiple_discrete_output_coils,
-            16: self.write_multiple_analog_output_holding_registers
-        }
-
-    def read_contact(self, index: int) -> bool:
-        self.contacts[index] = random.randint(0, 100) >= 50
-        return self.contacts[index]
-
-    def read_coil(self, index: int) -> bool:
-        if self.config.random and index not in self.coils:
-            self.coils[index] = random.randint(0, 100) > 50
-        return self.coils.get(index, False)
+        self.memory = memory if memory is not None else Memory()
+        self.contacts = self.memory.contacts
+        self.coils = self.memory.coils
+        self.input_registers = self.memory.input_registers
+        self.holding_registers = self.memory.holding_registers
+        if self.config.random and not self.memory.restored:
+            self.memory.randomize()
+        self.cache = ResponseCache(cache_size, lock) if cache_size > 0 else None
+        self.attach_signals(signals)
+
+    def attach_signals(self, signals):
+        """
+        :param signals: configured signals, the ones for this address are taken
+        """
+        self.signals = Signals([signal for signal in signals if self.address in signal.units]) or None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def invalidate(self, table: str, index: int, count: int):
+        """
+        Drop cached responses of written range, every write to tables must be followed by it
+        :param table: one of TABLES
+        """
+        if self.cache is not None:
+            self.cache.invalidate(table, index, count)
+
+    def cacheable(self, code: int, index: int, count: int) -> bool:
+        """
+        :return: True if response of read may be served from cache: values of the range change only by writes
+        """
+        table = Slave.read_tables.get(code)
+        if table is None or (table == 'contacts' and self.config.random_contacts):
+            return False
+        return not (self.signals and self.signals.overlaps(table, index, count))
+
+    def read_contacts(self, index: int, count: int) -> bytes:
+        if self.config.random_contacts:
+            self.contacts.write(index, count, random.getrandbits(count).to_bytes((count + 7) >> 3, byteorder='little'))
+        if self.signals:
+            self.signals.refresh('contacts', self.contacts, index, count)
+        return self.contacts.read(index, count)
+
+    def read_coils(self, index: int, count: int) -> bytes:
+        if self.signals:
+            self.signals.refresh('coils', self.coils, index, count)
+        return self.coils.read(index, count)
 
     def write_coil(self, index: int, state: bool):
-        self.coils[index] = state
+        self.coils.set(index, state)
+        self.invalidate('coils', index, 1)
+
+    def write_coils(self, index: int, count: int, values: bytes):
+        self.coils.write(index, count, values)
+        self.invalidate('coils', index, count)
+
+    def read_input_registers(self, index: int, count: int) -> memoryview:
+        if self.signals:
+            self.signals.refresh('input', self.input_registers, index, count)
+        return self.input_registers.read(index, count)
 
-    def read_register(self, index: int) -> bytes:
-        if self.config.random and index not in self.registers:
-            self.registers[index] = random.randint(0x0000, 0xFFFF).to_bytes(2, byteorder='big')
-        return self.registers.get(index, bytes([0x00, 0x00]))
+    def read_holding_registers(self, index: int, count: int) -> memoryview:
+        if self.signals:
+            self.signals.refresh('holding', self.holding_registers, index, count)
+        return self.holding_registers.read(index, count)
 
-    def write_register(self, index: int, value: bytes):
-        self.registers[index] = bytes([value[0], value[1]])
+    def write_registers(self, index: int, values: bytes):
+        self.holding_registers.write(index, values)
+        self.invalidate('holding', index, len(values) >> 1)
 
     def receive(self, slave_address: int, data: bytes):
         """
-        Parse incoming bytes
+        Decode request once, validate it against limits of its function code and call handler
         :param slave_address: First byte
         :param data: All received bytes
-        :return: True if there was no errors
+        :return: response, falsy value if connection must be dropped
         """
         if self.address != slave_address:
             logging.error(f'Slave #{self.address}: command slave_address mismatch: {slave_address}')
             return
-        # call appropriate method
-        code = int(data[7])
-        try:
-            response = self.commands[code](data)
-        except KeyError:
+        if self.cache is not None:
+            response = self.cache.get(data)
+            if response is not None:
+                return response
+        code = data[7]
+        command = Slave.commands.get(code)
+        if command is None:
             logging.error(f'Slave: command code wrong: {code}')
-            return bytes([0x80, 0x01])
+            return self.exception(data, code, 0x01)
+        if len(data) < command.length:
+            logging.error(f'command {code}: request too short: {len(data)}')
+            return self.exception(data, code, 0x03)
+        if command.max_quantity == 0:
+            (address, quantity) = (None, None)
+        else:
+            (_, _, address, quantity) = Slave.request.unpack_from(data, 6)
+        if command.max_quantity is None:
+            if address >= Memory.table_size:
+                logging.error(f'command {code}: data_address out of limits: {address}')
+                return self.exception(data, code, 0x02)
+        elif command.max_quantity:
+            if quantity == 0 or quantity > command.max_quantity:
+                logging.error(f'command {code}: quantity out of limits: {quantity}')
+                return self.exception(data, code, 0x03)
+            if address + quantity > Memory.table_size:
+                logging.error(f'command {code}: requested range out of limits: from {address} + {quantity}')
+                return self.exception(data, code, 0x02)
+        try:
+            if self.cache is None or not self.cacheable(code, address, quantity):
+                return command.handler(self, data, address, quantity)
+            version = self.cache.version
+            response = command.handler(self, data, address, quantity)
+            self.cache.store(data, response, version)
+            return response
         except Exception as e:
             logging.error(f'Slave: command error: {str(e)}')
             return False
+
+    def exception(self, request: bytes, code: int, exception_code: int) -> bytearray:
+        """
+        Build exception response
+        :param request: Request which caused exception
+        :param code: Function code of request
+        :param exception_code: 0x01 illegal function, 0x02 illegal data address, 0x03 illegal data value
+        :return: MBAP framed exception response
+        """
+        response = bytearray(9)
+        response[:4] = request[:4]
+        Slave.exception_header.pack_into(response, 4, 3, self.address, code | 0x80, exception_code)
         return response
 
-    def read_discrete_output_coils(self, request: bytes):
-        code = 0x01
-        data_address_offset = 1
-        response = request[:4]
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive number of coils to read
-        number_of_coils = request[10:12]
-        number_of_coils = int(0x0000 | (number_of_coils[0] << 8) | number_of_coils[1])
-        asked_data_bytes_len = ceil(number_of_coils/8)
-        response += int(asked_data_bytes_len + 3).to_bytes(length=2, byteorder='big')
-        response += bytes([self.address, code, asked_data_bytes_len])
-        # validate
-        try:
-            if data_address == 0 or data_address > 9999:
-                logging.error(f'command {code}: data_address out of limits: {data_address}')
-                raise None
-            if number_of_coils == 0 or number_of_coils > 9999:
-                logging.error(f'command {code}: number_of_coils out of limits: {number_of_coils}')
-                return bytes([0x80, 0x03])
-            if data_address + number_of_coils > 10000:
-                logging.error(f'command {code}: requested range out of limits: from {data_address} + {number_of_coils}')
-                raise None
-        except:
-            return bytes([0x80, 0x02])
-        # read asked coils
-        byte = None
-        for index in range(data_address, data_address + number_of_coils):
-            if (index - data_address) % 8 == 0:
-                if byte:  # if it is not first iteration we must append composed byte to response array
-                    response += byte
-                byte = b'\0'
-            if self.read_coil(index):
-                byte = bytes([byte[0] | (0x01 << (index - data_address) % 8)])
-        response += byte
+    def allocate_read_response(self, request: bytes, code: int, data_length: int) -> bytearray:
+        """
+        Allocate whole read response at once and fill its header
+        :param request: Read request
+        :param code: Function code
+        :param data_length: Number of data bytes following the header
+        :return: Response with data bytes left zeroed
+        """
+        response = bytearray(Slave.read_header_length + data_length)
+        response[:4] = request[:4]
+        Slave.read_header.pack_into(response, 4, data_length + 3, self.address, code, data_length)
         return response
 
-    def write_single_discrete_output_coil(self, request: bytes):
-        code = 0x05
-        data_address_offset = 1
-        response = request
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive value to set
-        value = request[10:12]
-        value = int(0x0000 | (value[0] << 8) | value[1])
-        # validate
-        if data_address == 0 or data_address > 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x85, 0x02])
-        if value == 0xFF00:
-            status = True
-        elif value == 0x0000:
-            status = False
-        else:
-            logging.error(f'command {code}: status value incorrect: {value.to_bytes(2, byteorder="big").hex()}')
-            return bytes([0x85, 0x03])
-        # set asked coil state
-        self.write_coil(data_address, state=status)
+    def allocate_write_response(self, request: bytes) -> bytearray:
+        """
+        Echo of multiple write request header: address and quantity
+        :param request: Write request
+        :return: Response with length fixed to 6
+        """
+        response = bytearray(request[:12])
+        response[4:6] = b'\x00\x06'
         return response
 
-    def write_multiple_discrete_output_coils(self, request: bytes):
-        code = 0x0F
-        data_address_offset = 1
-        response = request[:4] + (6).to_bytes(2, byteorder='big') + request[6:12]
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive number of coils
-        number_of_coils = request[10:12]
-        number_of_coils = int(0x0000 | (number_of_coils[0] << 8) | number_of_coils[1])
-        # receive values to set
-        try:
-            values = request[13:(13 + int(request[12]))]
-        except:
-            return bytes([0x8F, 0x03])
-        # validate
-        if data_address == 0 or data_address - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x80, 0x02])
-        if number_of_coils == 0 or number_of_coils > 9999:
-            logging.error(f'command {code}: number_of_coils out of limit: {number_of_coils}')
-            return bytes([0x8F, 0x03])
-        if data_address + number_of_coils - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: data_address + number_of_coils out of limit: {data_address + number_of_coils - data_address_offset}')
-            return bytes([0x8F, 0x02])
-        if len(values) != ceil(number_of_coils/8):
-            logging.error(f'command {code}: not all values received: {values.hex()}')
-            return bytes([0x8F, 0x03])
-        # set asked coils
-        for index in range(data_address, data_address + number_of_coils):
-            self.write_coil(index=index,
-                            state=int(values[int((index-data_address) / 8)]) & (0x01 << ((index-data_address) % 8)) > 0)
+    def write_values(self, request: bytes, code: int, expected_length: int, offset: int = 12):
+        """
+        Take values of multiple write request
+        :param request: FC15, FC16 or FC23 request
+        :param code: Function code
+        :param expected_length: number of value bytes quantity field asks for
+        :param offset: position of byte count field
+        :return: values or None if byte count or request length mismatch
+        """
+        byte_count = request[offset]
+        if byte_count != expected_length or len(request) < offset + 1 + byte_count:
+            logging.error(f'command {code}: not all values received: byte count {byte_count}, expected {expected_length}')
+            return None
+        return request[offset + 1:offset + 1 + byte_count]
+
+    def read_discrete_output_coils(self, request: bytes, address: int, quantity: int):
+        response = self.allocate_read_response(request, 0x01, (quantity + 7) >> 3)
+        response[Slave.read_header_length:] = self.read_coils(address, quantity)
         return response
 
-    def read_discrete_input_contacts(self, request: bytes):
-        code = 0x02
-        data_address_offset = 10001
-        response = request[:4]
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive number of coils to read
-        number_of_contacts = request[10:12]
-        number_of_contacts = int(0x0000 | (number_of_contacts[0] << 8) | number_of_contacts[1])
-        asked_data_bytes_len = ceil(number_of_contacts/8)
-        response += int(asked_data_bytes_len + 3).to_bytes(length=2, byteorder='big')
-        response += bytes([self.address, code, asked_data_bytes_len])
-        # validate
-        if data_address - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x82, 0x02])
-        if number_of_contacts == 0 or number_of_contacts > 9999:
-            logging.error(f'command {code}: number_of_coils out of limits: {number_of_contacts}')
-            return bytes([0x82, 0x03])
-        if data_address + number_of_contacts - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: requested range out of limits: from {data_address} + {number_of_contacts}')
-            return bytes([0x82, 0x02])
-        # read asked coils
-        byte = None
-        for index in range(data_address, data_address + number_of_contacts):
-            if (index - data_address) % 8 == 0:
-                if byte:  # if it is not first iteration we must append composed byte to response array
-                    response += byte
-                byte = b'\0'
-            if self.read_contact(index):
-                byte = bytes([byte[0] | (0x01 << (index - data_address) % 8)])
-        response += byte
+    def read_discrete_input_contacts(self, request: bytes, address: int, quantity: int):
+        response = self.allocate_read_response(request, 0x02, (quantity + 7) >> 3)
+        response[Slave.read_header_length:] = self.read_contacts(address, quantity)
         return response
 
-    def read_analog_input_registers(self, request: bytes):
-        code = 0x04
-        data_address_offset = 30001
-        response = request[:4]
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive number of registers to read
-        number_of_registers = request[10:12]
-        number_of_registers = int(0x0000 | (number_of_registers[0] << 8) | number_of_registers[1])
-        asked_data_bytes_len = number_of_registers*2
-        response += int(asked_data_bytes_len + 3).to_bytes(length=2, byteorder='big')
-        response += bytes([self.address, code, asked_data_bytes_len])
-        # validate
-        if data_address - data_address_offset + 1> 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x84, 0x02])
-        if number_of_registers == 0 or number_of_registers > 9999:
-            logging.error(f'command {code}: number_of_registers out of limits: {number_of_registers}')
-            return bytes([0x84, 0x03])
-        if data_address + number_of_registers - data_address_offset + 1> 9999:
-            logging.error(f'command {code}: requested range out of limits: from {data_address} + {number_of_registers}')
-            return bytes([0x84, 0x02])
-        # read asked registers
-        for index in range(data_address, data_address + number_of_registers):
-            response += self.read_register(index)
+    def read_analog_output_holding_registers(self, request: bytes, address: int, quantity: int):
+        response = self.allocate_read_response(request, 0x03, quantity * 2)
+        response[Slave.read_header_length:] = self.read_holding_registers(address, quantity)
         return response
 
-    def read_analog_output_holding_registers(self, request: bytes):
-        code = 0x03
-        data_address_offset = 40001
-        response = request[:4]
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive number of registers to read
-        number_of_registers = request[10:12]
-        number_of_registers = int(0x0000 | (number_of_registers[0] << 8) | number_of_registers[1])
-        asked_data_bytes_len = number_of_registers*2
-        response += int(asked_data_bytes_len + 3).to_bytes(length=2, byteorder='big')
-        response += bytes([self.address, code, asked_data_bytes_len])
-        # validate
-        if data_address - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x83, 0x02])
-        if number_of_registers == 0 or number_of_registers > 9999:
-            logging.error(f'command {code}: number_of_registers out of limits: {number_of_registers}')
-            return bytes([0x83, 0x03])
-        if data_address + number_of_registers - data_address_offset > 9999:
-            logging.error(f'command {code}: requested range out of limits: from {data_address} + {number_of_registers}')
-            return bytes([0x83, 0x02])
-        # read asked registers
-        for index in range(data_address, data_address + number_of_registers):
-            response += self.read_register(index)
+    def read_analog_input_registers(self, request: bytes, address: int, quantity: int):
+        response = self.allocate_read_response(request, 0x04, quantity * 2)
+        response[Slave.read_header_length:] = self.read_input_registers(address, quantity)
         return response
 
-    def write_single_analog_output_holding_register(self, request: bytes):
-        code = 0x06
-        data_address_offset = 40001
-        response = request
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive value to set
-        value = request[10:12]
-        value = int(0x0000 | (value[0] << 8) | value[1])
-        # validate
-        if data_address == 0 or data_address - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x86, 0x02])
-        # set asked coil state
-        self.write_register(index=data_address, value=value.to_bytes(2, byteorder='big'))
+    def write_single_discrete_output_coil(self, request: bytes, address: int, value: int):
+        if value == 0xFF00:
+            status = True
+        elif value == 0x0000:
+            status = False
+        else:
+            logging.error(f'command 5: status value incorrect: {value:04x}')
+            return self.exception(request, 0x05, 0x03)
+        self.write_coil(address, state=status)
+        return request
+
+    def write_single_analog_output_holding_register(self, request: bytes, address: int, value: int):
+        self.write_registers(index=address, values=request[10:12])
+        return request
+
+    def write_multiple_discrete_output_coils(self, request: bytes, address: int, quantity: int):
+        values = self.write_values(request, 0x0F, (quantity + 7) >> 3)
+        if values is None:
+            return self.exception(request, 0x0F, 0x03)
+        self.write_coils(index=address, count=quantity, values=values)
+        return self.allocate_write_response(request)
+
+    def write_multiple_analog_output_holding_registers(self, request: bytes, address: int, quantity: int):
+        values = self.write_values(request, 0x10, quantity * 2)
+        if values is None:
+            return self.exception(request, 0x10, 0x03)
+        self.write_registers(index=address, values=values)
+        return self.allocate_write_response(request)
+
+    def mask_write_holding_register(self, request: bytes, address: int, and_mask: int):
+        (or_mask,) = Slave.mask_request.unpack_from(request, 12)
+        self.holding_registers.mask(address, and_mask, or_mask)
+        self.invalidate('holding', address, 1)
+        return request
+
+    def read_write_multiple_holding_registers(self, request: bytes, address: int, quantity: int):
+        (write_address, write_quantity, _) = Slave.write_request.unpack_from(request, 12)
+        if write_quantity == 0 or write_quantity > 121:
+            logging.error(f'command 23: write quantity out of limits: {write_quantity}')
+            return self.exception(request, 0x17, 0x03)
+        values = self.write_values(request, 0x17, write_quantity * 2, offset=16)
+        if values is None:
+            return self.exception(request, 0x17, 0x03)
+        if write_address + write_quantity > Memory.table_size:
+            logging.error(f'command 23: write range out of limits: from {write_address} + {write_quantity}')
+            return self.exception(request, 0x17, 0x02)
+        # write is performed before read, as specification requires
+        self.write_registers(index=write_address, values=values)
+        response = self.allocate_read_response(request, 0x17, quantity * 2)
+        response[Slave.read_header_length:] = self.read_holding_registers(address, quantity)
         return response
 
-    def write_multiple_analog_output_holding_registers(self, request: bytes):
-        code = 0x10
-        data_address_offset = 40001
-        response = request[:12]
-        # receive data address
-        data_address = request[8:10]
-        data_address = int(0x0000 | (data_address[0] << 8) | data_address[1]) + data_address_offset
-        # receive number of registers
-        number_of_registers = request[10:12]
-        number_of_registers = int(0x0000 | (number_of_registers[0] << 8) | number_of_registers[1])
-        # receive values to set
-        try:
-            values = request[13:(13 + int(request[12]))]
-        except Exception as e:
-            logging.error(f'command {code}: values subrange taking error: {str(e)}')
-            return bytes([0x90, 0x03])
-        # validate
-        if data_address == 0 or data_address - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: data_address out of limits: {data_address}')
-            return bytes([0x90, 0x02])
-        if data_address + number_of_registers*2 - data_address_offset + 1 > 9999:
-            logging.error(f'command {code}: range out of limits: {data_address+number_of_registers*2-data_address_offset+1}')
-            return bytes([0x90, 0x02])
-        if len(values) == 0 or len(values) != number_of_registers * 2:
-            logging.error(f'command {code}: not enough values bytes: {len(values)}')
-            return bytes([0x90, 0x03])
-        # set asked coils
-        for index in range(data_address, data_address + number_of_registers):
-            values_index = (index-data_address)*2
-            self.write_register(index=index,
-                                value=values[values_index:values_index+2])
+    def read_device_identification(self, request: bytes, address, quantity):
+        if request[8] != 0x0E:
+            logging.error(f'command 43: MEI type is not supported: {request[8]}')
+            return self.exception(request, 0x2B, 0x01)
+        (code, first) = (request[9], request[10])
+        pdu = Slave.identification.get((code, first))
+        if pdu is None:
+            if code not in (0x01, 0x02, 0x03):
+                logging.error(f'command 43: read device id code {code} or object id {first} out of limits')
+                return self.exception(request, 0x2B, 0x03 if code != 0x04 else 0x02)
+            # stream access restarts from the first object if asked one does not exist
+            pdu = Slave.identification[(code, 0x00)]
+        response = bytearray(request[:4])
+        response += Slave.pdu_header.pack(len(pdu) + 1, self.address)
+        response += pdu
         return response
+
+    # function code -> table read, responses of these reads are cached
+    read_tables = {code: table for table, code in READ_CODES.items()}
+
+    # function code -> command, limits follow Modbus application protocol specification
+    commands = {
+        0x01: Command(read_discrete_output_coils, 2000, 12),
+        0x02: Command(read_discrete_input_contacts, 2000, 12),
+        0x03: Command(read_analog_output_holding_registers, 125, 12),
+        0x04: Command(read_analog_input_registers, 125, 12),
+        0x05: Command(write_single_discrete_output_coil, None, 12),
+        0x06: Command(write_single_analog_output_holding_register, None, 12),
+        0x0F: Command(write_multiple_discrete_output_coils, 1968, 13),
+        0x10: Command(write_multiple_analog_output_holding_registers, 123, 13),
+        0x16: Command(mask_write_holding_register, None, 14),
+        0x17: Command(read_write_multiple_holding_registers, 125, 17),
+        0x2B: Command(read_device_identification, 0, 11),
+    }
+
+
+class Slaves:
+    """
+    Slaves served, materialized on first request to their unit id.
+    """
+    def __init__(self, units, memory=None, signals=(), lock=None, cache_size=0):
+        """
+        :param units: unit ids, may be sparse
+        :param memory: SharedMemory slaves are placed in, every slave allocates its own if omitted
+        :param signals: configured signals
+        :param lock: lock guarding bit tables of private memories, if they are written by several threads
+        :param cache_size: read responses cached by every slave, 0 if tables are written by other processes
+        """
+        self.memory = memory
+        self.lock = lock
+        self.cache_size = cache_size
+        self.units = Slaves.validate(units, memory)
+        self.signals = signals
+        self.seed = Configuration().slave.random
+        self.slaves = {}
+
+    @staticmethod
+    def validate(units, memory) -> frozenset:
+        units = frozenset(units)
+        if not all(1 <= unit <= 247 for unit in units):
+            raise ValueError('Slaves: unit ids must be in limits [1; 247]')
+        if memory is not None and units and max(units) > memory.slots:
+            raise ValueError(f'Slaves: shared memory has no slots for unit ids above {memory.slots}')
+        return units
+
+    def update(self, units, signals=()):
+        """
+        Apply reloaded configuration. Slaves of removed unit ids are kept aside with their tables,
+        so they come back intact if the unit id is added again. Random seeding applies to slaves
+        materialized from now on, tables of existing ones are not touched.
+        :param units: unit ids served from now on
+        :param signals: configured signals, they replace the ones of materialized slaves
+        """
+        self.units = Slaves.validate(units, self.memory)
+        self.signals = signals
+        self.seed = Configuration().slave.random
+        # injection threads may materialize slaves of just added unit ids meanwhile
+        for slave in list(self.slaves.values()):
+            slave.attach_signals(signals)
+
+    def __len__(self):
+        return len(self.units)
+
+    def __contains__(self, address: int):
+        return address in self.units
+
+    def get(self, address: int):
+        """
+        :param address: unit id
+        :return: Slave or None if this unit id is not served
+        """
+        if address not in self.units:
+            return None
+        slave = self.slaves.get(address)
+        if slave is None:
+            if self.memory is not None:
+                memory = self.memory.slot(address, seed=self.seed)
+            else:
+                memory = Memory(lock=self.lock)
+            slave = Slave(address=bytes([address]), memory=memory, signals=self.signals, cache_size=self.cache_size,
+                          lock=self.lock)
+            # injection thread may materialize the same slave concurrently, first one stored wins
+            slave = self.slaves.setdefault(address, slave)
+            logging.debug(f'Slaves: slave #{address} materialized')
+        return slave
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Snapshot and restore of slaves state file, also while emulator is running.
+# Usage: modbus-slave-state snapshot STATE_FILE SNAPSHOT_FILE
+#        modbus-slave-state restore SNAPSHOT_FILE STATE_FILE
+
+import argparse
+import mmap
+import os
+
+from main.memory import SharedMemory, Memory
+
+
+def snapshot(state_path: str, snapshot_path: str):
+    """
+    Copy state file to snapshot, which is replaced atomically: it is either old or complete new one.
+    Tables are copied as they are, writes of running emulator during the copy may be partially included
+    :param state_path: state file, may be mapped by running emulator
+    :param snapshot_path: destination
+    """
+    with open(state_path, 'rb') as state:
+        with mmap.mmap(state.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            SharedMemory.read_header(mapping)
+            temporary = f'{snapshot_path}.tmp'
+            with open(temporary, 'wb') as file:
+                file.write(mapping)
+                file.flush()
+                os.fsync(file.fileno())
+    os.replace(temporary, snapshot_path)
+
+
+def restore(snapshot_path: str, state_path: str):
+    """
+    Copy snapshot into state file in place, with a single bulk copy.
+    Running emulator maps the same pages, so it serves restored tables at once. The copy is not atomic
+    for it: readers take no lock, so requests answered meanwhile may see a mix of old and restored values.
+    Only a state file that does not exist yet is created atomically.
+    Slots missing in one of files are left untouched.
+    :param snapshot_path: snapshot made by snapshot()
+    :param state_path: state file
+    """
+    with open(snapshot_path, 'rb') as file:
+        data = file.read()
+    slots = SharedMemory.read_header(data)
+    if not os.path.exists(state_path):
+        with open(f'{state_path}.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(f'{state_path}.tmp', state_path)
+        return
+    with open(state_path, 'r+b') as state:
+        with mmap.mmap(state.fileno(), 0) as mapping:
+            slots = min(slots, SharedMemory.read_header(mapping))
+            end = SharedMemory.header_length + slots * Memory.size
+            mapping[SharedMemory.header_length:end] = data[SharedMemory.header_length:end]
+            flags = slice(SharedMemory.flags_offset + 1, SharedMemory.flags_offset + slots + 1)
+            mapping[flags] = data[flags]
+            mapping.flush()
+
+
+def entrypoint(argv=None):
+    parser = argparse.ArgumentParser(prog='modbus-slave-state', description='Snapshot and restore of slaves state file')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('snapshot', help='copy state file to snapshot')
+    command.add_argument('state')
+    command.add_argument('snapshot')
+    command = commands.add_parser('restore', help='load snapshot into state file')
+    command.add_argument('snapshot')
+    command.add_argument('state')
+    args = parser.parse_args(argv)
+    if args.command == 'snapshot':
+        snapshot(args.state, args.snapshot)
+    elif args.command == 'restore':
+        restore(args.snapshot, args.state)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    entrypoint()
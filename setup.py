@@ -29,6 +29,9 @@ setup(
     entry_points={
         'console_scripts': [
             'modbus-slave = main.main:entrypoint',
+            'modbus-slave-benchmark = main.benchmark.runner:entrypoint',
+            'modbus-slave-state = main.state:entrypoint',
+            'modbus-slave-replay = main.benchmark.replay:entrypoint',
         ],
     },
     zip_safe=False
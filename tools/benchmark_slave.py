@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Micro-benchmark of Slave request handlers, no sockets involved.
+# Usage: python tools/benchmark_slave.py [repetitions]
+
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main.slave import Slave  # noqa: E402
+
+QUANTITIES = (1, 16, 125)
+CODES = {
+    0x03: 'read holding registers',
+    0x04: 'read input registers',
+    0x01: 'read coils',
+    0x02: 'read contacts',
+}
+
+
+def request(code: int, quantity: int) -> bytes:
+    return struct.pack('>HHHBBHH', 1, 0, 6, 1, code, 0, quantity)
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    slave = Slave(address=bytes([1]))
+    print(f'{"function code":<28}{"quantity":>10}{"us/request":>14}')
+    for code, name in CODES.items():
+        for quantity in QUANTITIES:
+            data = request(code, quantity)
+            seconds = min(timeit.repeat(lambda: slave.receive(slave_address=1, data=data),
+                                        number=repetitions, repeat=3))
+            print(f'{f"{code:02d} {name}":<28}{quantity:>10}{seconds / repetitions * 1e6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
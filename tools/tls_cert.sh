@@ -0,0 +1,10 @@
+#!/usr/bin/env bash
+# Self-signed certificate for Modbus/TCP Security tests.
+# Usage: tools/tls_cert.sh [directory] [common name]
+set -e
+DIR=${1:-.}
+NAME=${2:-localhost}
+openssl req -x509 -newkey ec -pkeyopt ec_paramgen_curve:prime256v1 -nodes -days 365 \
+	-subj "/CN=$NAME" -addext "subjectAltName=DNS:$NAME,IP:127.0.0.1" \
+	-keyout "$DIR/modbus.key" -out "$DIR/modbus.crt"
+echo "TLS_CERT=$DIR/modbus.crt TLS_KEY=$DIR/modbus.key"